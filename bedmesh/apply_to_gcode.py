@@ -1,8 +1,10 @@
 import math
-from typing import List, Dict, Union
+from typing import List, Dict, Iterable, Iterator, Union
 
 from scipy.interpolate import RectBivariateSpline
 
+from bedmesh.interpolate import _make_interpolator_grid
+from bedmesh.klipper_mesh import KlipperZMesh
 from bedmesh.parse import SurfaceMesh
 
 
@@ -37,7 +39,9 @@ def format_gcode_line(cmd: str, params: Dict[str, Union[str, float]]) -> str:
     return " ".join(parts)
 
 
-def interpolate_surface_z(interpolator: RectBivariateSpline, x: float, y: float) -> float:
+def interpolate_surface_z(interpolator: Union[RectBivariateSpline, KlipperZMesh], x: float, y: float) -> float:
+    if isinstance(interpolator, KlipperZMesh):
+        return interpolator.calc_z(x, y)
     return float(interpolator(y, x)[0][0])
 
 
@@ -78,26 +82,30 @@ def collapse_segments(segments: List[Dict[str, float]], split_delta_z: float) ->
     return result
 
 
-def apply_bed_mesh_to_gcode(
-        gcode_lines: List[str],
+def iter_bed_mesh_gcode(
+        gcode_lines: Iterable[str],
         surface: SurfaceMesh,
         move_check_distance: float = 1.0,
-        split_delta_z: float = 0.01
-) -> List[str]:
-    interpolator = RectBivariateSpline(surface.y, surface.x, surface.z)
-    output_lines = []
+        split_delta_z: float = 0.01,
+        method: str = "spline"
+) -> Iterator[str]:
+    """
+    Потоковый вариант apply_bed_mesh_to_gcode: читает строки по одной и сразу
+    отдаёт результат, не держа весь G-code в памяти.
+    """
+    interpolator = _make_interpolator_grid(surface, method)
     last_pos: Dict[str, Union[float, None]] = {"X": 0.0, "Y": 0.0, "Z": 0.0, "E": 0.0, "F": None}
 
     for line in gcode_lines:
         stripped = line.strip()
         if not stripped or stripped.startswith(";") or stripped.startswith("M") or stripped.startswith(
                 "T") or "EXCLUDE_OBJECT" in stripped:
-            output_lines.append(line)
+            yield line
             continue
 
         cmd = parse_gcode_line(stripped)
         if not cmd or cmd["cmd"] not in {"G0", "G1"}:
-            output_lines.append(line)
+            yield line
             continue
 
         start = last_pos.copy()
@@ -121,8 +129,16 @@ def apply_bed_mesh_to_gcode(
             merged = {**{"cmd": cmd["cmd"]}, **seg}
             if "F" in cmd:
                 merged["F"] = cmd["F"]
-            output_lines.append(format_gcode_line(merged["cmd"], merged))
+            yield format_gcode_line(merged["cmd"], merged)
 
         last_pos.update(end)
 
-    return output_lines
+
+def apply_bed_mesh_to_gcode(
+        gcode_lines: List[str],
+        surface: SurfaceMesh,
+        move_check_distance: float = 1.0,
+        split_delta_z: float = 0.01,
+        method: str = "spline"
+) -> List[str]:
+    return list(iter_bed_mesh_gcode(gcode_lines, surface, move_check_distance, split_delta_z, method))
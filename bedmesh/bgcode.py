@@ -0,0 +1,365 @@
+"""
+Чтение и запись бинарного G-code Prusa (.bgcode, формат libbgcode v1).
+
+Файл: заголовок "GCDE" + version (u32) + checksum_type (u16), далее блоки:
+заголовок блока (type u16, compression u16, uncompressed_size u32,
+compressed_size u32 — только при сжатии), параметры (encoding u16,
+у миниатюр — format/width/height), данные и CRC32 (если checksum_type = 1).
+
+Heatshrink сжимается и распаковывается C-библиотекой heatshrink2, если она
+установлена (pip install heatshrink2), иначе — кодеком на чистом Python
+(в ~10-25 раз медленнее).
+"""
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+
+try:
+    import heatshrink2
+except ImportError:
+    heatshrink2 = None
+
+# Есть ли скомпилированный heatshrink; без него кодирование ~0.7 МБ/с
+HEATSHRINK_NATIVE = heatshrink2 is not None
+
+MAGIC = b"GCDE"
+
+BLOCK_FILE_METADATA = 0
+BLOCK_GCODE = 1
+BLOCK_THUMBNAIL = 5
+
+COMPRESSION_NONE = 0
+COMPRESSION_DEFLATE = 1
+COMPRESSION_HEATSHRINK_11_4 = 2
+COMPRESSION_HEATSHRINK_12_4 = 3
+
+# Имена для командной строки
+COMPRESSION_NAMES = {
+    "none": COMPRESSION_NONE,
+    "deflate": COMPRESSION_DEFLATE,
+    "heatshrink11": COMPRESSION_HEATSHRINK_11_4,
+    "heatshrink12": COMPRESSION_HEATSHRINK_12_4,
+}
+
+ENCODING_NONE = 0
+ENCODING_MEATPACK = 1
+ENCODING_MEATPACK_COMMENTS = 2
+
+CHECKSUM_NONE = 0
+CHECKSUM_CRC32 = 1
+
+# Размер несжатого G-code блока, как у PrusaSlicer
+GCODE_BLOCK_SIZE = 65536
+
+_HEATSHRINK_PARAMS = {
+    COMPRESSION_HEATSHRINK_11_4: (11, 4),
+    COMPRESSION_HEATSHRINK_12_4: (12, 4),
+}
+
+
+@dataclass
+class Block:
+    type: int
+    compression: int
+    uncompressed_size: int
+    params: bytes
+    data: bytes
+    # Исходные байты заголовка, параметров и данных с контрольной суммой — для копирования как есть
+    raw: bytes
+
+    @property
+    def encoding(self) -> int:
+        return struct.unpack_from("<H", self.params)[0]
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("Неожиданный конец файла bgcode")
+    return data
+
+
+def read_file_header(stream: BinaryIO) -> Tuple[int, int]:
+    """
+    Читает заголовок файла, возвращает (version, checksum_type).
+    """
+    header = _read_exact(stream, 10)
+    if header[:4] != MAGIC:
+        raise ValueError("Файл не является bgcode")
+    version, checksum_type = struct.unpack("<IH", header[4:])
+    return version, checksum_type
+
+
+def write_file_header(stream: BinaryIO, version: int = 1, checksum_type: int = CHECKSUM_CRC32) -> None:
+    stream.write(MAGIC + struct.pack("<IH", version, checksum_type))
+
+
+def iter_blocks(stream: BinaryIO, checksum_type: int) -> Iterator[Block]:
+    """
+    Последовательно читает блоки после заголовка файла, проверяя CRC32.
+    """
+    while True:
+        head = stream.read(8)
+        if not head:
+            return
+        if len(head) != 8:
+            raise ValueError("Неожиданный конец файла bgcode")
+        block_type, compression, uncompressed_size = struct.unpack("<HHI", head)
+        if compression != COMPRESSION_NONE:
+            extra = _read_exact(stream, 4)
+            head += extra
+            data_size = struct.unpack("<I", extra)[0]
+        else:
+            data_size = uncompressed_size
+
+        params = _read_exact(stream, 6 if block_type == BLOCK_THUMBNAIL else 2)
+        data = _read_exact(stream, data_size)
+        raw = head + params + data
+        if checksum_type == CHECKSUM_CRC32:
+            checksum = _read_exact(stream, 4)
+            if struct.unpack("<I", checksum)[0] != zlib.crc32(raw):
+                raise ValueError("Неверная контрольная сумма блока bgcode")
+            raw += checksum
+        yield Block(block_type, compression, uncompressed_size, params, data, raw)
+
+
+def write_block(
+        stream: BinaryIO,
+        block_type: int,
+        payload: bytes,
+        compression: int,
+        params: bytes,
+        checksum_type: int
+) -> None:
+    """
+    Сжимает payload и записывает блок целиком.
+    """
+    data = compress(payload, compression)
+    if compression == COMPRESSION_NONE:
+        head = struct.pack("<HHI", block_type, compression, len(payload))
+    else:
+        head = struct.pack("<HHII", block_type, compression, len(payload), len(data))
+    raw = head + params + data
+    if checksum_type == CHECKSUM_CRC32:
+        raw += struct.pack("<I", zlib.crc32(raw))
+    stream.write(raw)
+
+
+def compress(payload: bytes, compression: int) -> bytes:
+    if compression == COMPRESSION_NONE:
+        return payload
+    if compression == COMPRESSION_DEFLATE:
+        return zlib.compress(payload)
+    if compression in _HEATSHRINK_PARAMS:
+        window_sz2, lookahead_sz2 = _HEATSHRINK_PARAMS[compression]
+        if HEATSHRINK_NATIVE:
+            return heatshrink2.compress(payload, window_sz2=window_sz2, lookahead_sz2=lookahead_sz2)
+        return heatshrink_encode(payload, window_sz2, lookahead_sz2)
+    raise ValueError(f"Неизвестный тип сжатия bgcode: {compression}")
+
+
+def decompress(data: bytes, compression: int, uncompressed_size: int) -> bytes:
+    if compression == COMPRESSION_NONE:
+        return data
+    if compression == COMPRESSION_DEFLATE:
+        payload = zlib.decompress(data)
+    elif compression in _HEATSHRINK_PARAMS:
+        window_sz2, lookahead_sz2 = _HEATSHRINK_PARAMS[compression]
+        if HEATSHRINK_NATIVE:
+            payload = heatshrink2.decompress(data, window_sz2=window_sz2, lookahead_sz2=lookahead_sz2)
+        else:
+            payload = heatshrink_decode(data, window_sz2, lookahead_sz2)
+    else:
+        raise ValueError(f"Неизвестный тип сжатия bgcode: {compression}")
+    if len(payload) != uncompressed_size:
+        raise ValueError("Размер распакованного блока bgcode не совпадает с заголовком")
+    return payload
+
+
+def decode_gcode_block(block: Block) -> str:
+    payload = decompress(block.data, block.compression, block.uncompressed_size)
+    if block.encoding == ENCODING_NONE:
+        return payload.decode("utf-8")
+    if block.encoding in (ENCODING_MEATPACK, ENCODING_MEATPACK_COMMENTS):
+        return meatpack_decode(payload)
+    raise ValueError(f"Неизвестная кодировка G-code блока: {block.encoding}")
+
+
+def heatshrink_decode(data: bytes, window_sz2: int, lookahead_sz2: int) -> bytes:
+    """
+    LZSS heatshrink: бит 1 — литерал (8 бит), бит 0 — ссылка назад
+    (смещение - 1 в window_sz2 бит, длина - 1 в lookahead_sz2 бит). Биты идут от старшего.
+    Поток разворачивается в строку битов один раз — поля читаются срезами без побитовых вызовов.
+    """
+    bits = format(int.from_bytes(data, "big"), f"0{len(data) * 8}b") if data else ""
+    end = len(bits)
+    ref_bits = window_sz2 + lookahead_sz2
+    out = bytearray()
+    pos = 0
+    while pos < end:
+        if bits[pos] == "1":
+            if pos + 9 > end:
+                break
+            out.append(int(bits[pos + 1:pos + 9], 2))
+            pos += 9
+            continue
+        if pos + 1 + ref_bits > end:
+            break
+        index = int(bits[pos + 1:pos + 1 + window_sz2], 2)
+        count = int(bits[pos + 1 + window_sz2:pos + 1 + ref_bits], 2) + 1
+        pos += 1 + ref_bits
+        start = len(out) - index - 1
+        if start < 0:
+            raise ValueError("Некорректная ссылка в потоке heatshrink")
+        if start + count <= len(out):
+            out += out[start:start + count]
+        else:
+            # Перекрывающаяся ссылка (повтор последних байт) — побайтно
+            for i in range(count):
+                out.append(out[start + i])
+    return bytes(out)
+
+
+def heatshrink_encode(data: bytes, window_sz2: int, lookahead_sz2: int) -> bytes:
+    """
+    Жадный кодировщик heatshrink, совместимый с heatshrink_decode и прошивкой.
+    Самое длинное совпадение в окне 2^window_sz2 байт ищется bytes.rfind
+    двоичным поиском по длине: если есть совпадение длины L, есть и всех меньших.
+    """
+    window = 1 << window_sz2
+    max_len = 1 << lookahead_sz2
+    # Ссылка (1 + window_sz2 + lookahead_sz2 бит) выгоднее литералов (9 бит на байт)
+    min_len = (1 + window_sz2 + lookahead_sz2) // 9 + 1
+    index_format = f"0{window_sz2}b"
+    count_format = f"0{lookahead_sz2}b"
+
+    parts = []
+    i = 0
+    size = len(data)
+    while i < size:
+        lo = max(0, i - window)
+        best_len = 0
+        best_pos = -1
+        low, high = min_len, min(max_len, size - i)
+        while low <= high:
+            length = (low + high) // 2
+            found = data.rfind(data[i:i + length], lo, i - 1 + length)
+            if found < 0:
+                high = length - 1
+            else:
+                best_len, best_pos = length, found
+                low = length + 1
+
+        if best_len:
+            parts.append("0" + format(i - best_pos - 1, index_format) + format(best_len - 1, count_format))
+            i += best_len
+        else:
+            parts.append("1" + format(data[i], "08b"))
+            i += 1
+
+    bits = "".join(parts)
+    if not bits:
+        return b""
+    bits += "0" * (-len(bits) % 8)
+    return int(bits, 2).to_bytes(len(bits) // 8, "big")
+
+
+_MEATPACK_SIGNAL = 0xFF
+_MEATPACK_ENABLE = 0xFB
+_MEATPACK_DISABLE = 0xFA
+_MEATPACK_RESET = 0xF9
+_MEATPACK_NO_SPACES_ON = 0xF7
+_MEATPACK_NO_SPACES_OFF = 0xF6
+_MEATPACK_CHARS = "0123456789. \nGX"
+_MEATPACK_CHARS_NO_SPACES = "0123456789.E\nGX"
+
+
+def meatpack_decode(payload: bytes) -> str:
+    """
+    Распаковывает MeatPack: два символа из таблицы в байте (4 бита на символ),
+    0b1111 — символ передаётся следующим байтом целиком. В режиме без пробелов
+    код 0b1011 означает 'E', а пробелы перед параметрами G-команд восстанавливаются.
+    """
+    packing = False
+    no_spaces = False
+    signal_count = 0
+    command_pending = False
+    full_char_queue = 0
+    char_buf = ""
+    decoded = []
+
+    def rx(c: int) -> None:
+        nonlocal full_char_queue, char_buf
+        if not packing:
+            decoded.append(chr(c))
+            return
+        if full_char_queue > 0:
+            decoded.append(chr(c))
+            if char_buf:
+                decoded.append(char_buf)
+                char_buf = ""
+            full_char_queue -= 1
+            return
+        low, high = c & 0xF, c >> 4
+        table = _MEATPACK_CHARS_NO_SPACES if no_spaces else _MEATPACK_CHARS
+        if low == 0xF:
+            full_char_queue += 1
+            if high == 0xF:
+                full_char_queue += 1
+            else:
+                char_buf = table[high]
+        else:
+            decoded.append(table[low])
+            if table[low] != "\n":
+                if high == 0xF:
+                    full_char_queue += 1
+                else:
+                    decoded.append(table[high])
+
+    for c in payload:
+        if c == _MEATPACK_SIGNAL:
+            if signal_count > 0:
+                command_pending = True
+                signal_count = 0
+            else:
+                signal_count += 1
+            continue
+        if command_pending:
+            if c == _MEATPACK_ENABLE:
+                packing = True
+            elif c in (_MEATPACK_DISABLE, _MEATPACK_RESET):
+                packing = False
+            elif c == _MEATPACK_NO_SPACES_ON:
+                no_spaces = True
+            elif c == _MEATPACK_NO_SPACES_OFF:
+                no_spaces = False
+            command_pending = False
+            continue
+        if signal_count > 0:
+            rx(_MEATPACK_SIGNAL)
+            signal_count = 0
+        rx(c)
+
+    return "\n".join(_restore_spaces(line) for line in "".join(decoded).split("\n"))
+
+
+def _restore_spaces(line: str) -> str:
+    if not line.startswith("G"):
+        return line
+    code, sep, comment = line.partition(";")
+    parts = []
+    for i, ch in enumerate(code):
+        if i > 0 and ch.isalpha() and ch.isupper() and code[i - 1] != " ":
+            parts.append(" ")
+        parts.append(ch)
+    return "".join(parts) + sep + comment
+
+
+def iter_gcode_text(blocks: Iterable[Block]) -> Iterator[str]:
+    """
+    Текст всех G-code блоков по порядку.
+    """
+    for block in blocks:
+        if block.type == BLOCK_GCODE:
+            yield decode_gcode_block(block)
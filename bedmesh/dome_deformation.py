@@ -12,7 +12,8 @@ def dome_deformation(x: float, y: float, Lx: float = 350.0, Ly: float = 350.0, d
 def apply_dome_compensation(
         mesh: SurfaceMesh,
         delta: float,
-        compensation: float
+        compensation: float,
+        inplace: bool = False
 ) -> SurfaceMesh:
     """
     Применяет компенсацию куполообразной деформации к SurfaceMesh.
@@ -20,21 +21,23 @@ def apply_dome_compensation(
     :param mesh: исходная сетка
     :param delta: высота подъёма в центре (мм)
     :param compensation: коэффициент компенсации [0..1], где 1 — полная компенсация
-    :return: новая сетка с модифицированной матрицей z
+    :param inplace: изменить mesh.z на месте, без копирования сетки
+    :return: сетка с модифицированной матрицей z (новая, либо сам mesh при inplace)
     """
     Lx = float(np.max(mesh.x)) - float(np.min(mesh.x))
     Ly = float(np.max(mesh.y)) - float(np.min(mesh.y))
     x0 = float(np.min(mesh.x))
     y0 = float(np.min(mesh.y))
 
-    z_new = mesh.z.copy()
+    z_new = mesh.z if inplace else mesh.z.copy()
 
-    for iy, y in enumerate(mesh.y):
-        for ix, x in enumerate(mesh.x):
-            fx = x - x0
-            fy = y - y0
-            correction = dome_deformation(fx, fy, Lx, Ly, delta)
-            z_new[iy, ix] += compensation * correction
+    # dome_deformation работает и с массивами: строка fx на столбец fy
+    correction = dome_deformation((mesh.x - x0)[None, :], (mesh.y - y0)[:, None], Lx, Ly, delta)
+    correction *= compensation
+    z_new += correction
 
+    if inplace:
+        mesh.z_top = None
+        return mesh
     z_top = float(np.max(z_new))
-    return SurfaceMesh(x=mesh.x.copy(), y=mesh.y.copy(), z=z_new, z_top=z_top)
+    return SurfaceMesh(x=mesh.x.copy(), y=mesh.y.copy(), z=z_new, z_top=z_top, meta=mesh.meta)
@@ -0,0 +1,273 @@
+import gzip
+import os
+import queue
+import shutil
+import struct
+import tempfile
+import threading
+import warnings
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional
+
+from bedmesh import bgcode
+
+GCODE_FORMATS = ("plain", "gzip", "bgcode")
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+# Размер порции текста, передаваемой потоку записи
+_CHUNK_SIZE = 1 << 16
+
+# С какого размера исходника предупреждать о медленном heatshrink на Python
+_SLOW_HEATSHRINK_SIZE = 4 << 20
+
+
+def detect_gcode_format(path: str) -> str:
+    """
+    Определяет формат файла по первым байтам: gzip, bgcode или обычный текст.
+    """
+    with open(path, "rb") as f:
+        head = f.read(4)
+    if head.startswith(_GZIP_MAGIC):
+        return "gzip"
+    if head == bgcode.MAGIC:
+        return "bgcode"
+    return "plain"
+
+
+def format_from_extension(path: str) -> Optional[str]:
+    lower = path.lower()
+    if lower.endswith(".gz"):
+        return "gzip"
+    if lower.endswith(".bgcode"):
+        return "bgcode"
+    if lower.endswith(".gcode"):
+        return "plain"
+    return None
+
+
+def _split_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Режет поток кусков текста на строки без символа перевода строки.
+    """
+    tail = ""
+    for chunk in chunks:
+        lines = (tail + chunk).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line[:-1] if line.endswith("\r") else line
+    if tail:
+        yield tail
+
+
+def _iter_text_lines(stream) -> Iterator[str]:
+    for line in stream:
+        yield line.rstrip("\r\n")
+
+
+def _join_chunks(lines: Iterable[str]) -> Iterator[bytes]:
+    """
+    Склеивает строки в порции по ~_CHUNK_SIZE байт.
+    """
+    buf = []
+    size = 0
+    for line in lines:
+        buf.append(line)
+        size += len(line) + 1
+        if size >= _CHUNK_SIZE:
+            yield ("\n".join(buf) + "\n").encode("utf-8")
+            buf = []
+            size = 0
+    if buf:
+        yield ("\n".join(buf) + "\n").encode("utf-8")
+
+
+def _pipelined(chunks: Iterable[bytes], write: Callable[[bytes], None], depth: int = 4) -> None:
+    """
+    Запись (и сжатие) в отдельном потоке, пока основной поток читает, распаковывает
+    и преобразует следующие порции. Параллельно идут только стадии, отпускающие GIL:
+    zlib (gzip, deflate) и запись на диск. Heatshrink (heatshrink2 или кодек на Python)
+    держит GIL — с ним поток записи лишь чередуется с основным.
+    """
+    pending: "queue.Queue" = queue.Queue(maxsize=depth)
+    error = []
+
+    def writer():
+        while True:
+            chunk = pending.get()
+            if chunk is None:
+                return
+            if not error:
+                try:
+                    write(chunk)
+                except BaseException as exc:
+                    error.append(exc)
+
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    try:
+        for chunk in chunks:
+            if error:
+                break
+            pending.put(chunk)
+    finally:
+        pending.put(None)
+        thread.join()
+    if error:
+        raise error[0]
+
+
+class _GcodeBlockWriter:
+    """
+    Копит текст и пишет его G-code блоками bgcode по GCODE_BLOCK_SIZE байт.
+    """
+
+    def __init__(self, stream: BinaryIO, compression: int, checksum_type: int):
+        self.stream = stream
+        self.compression = compression
+        self.checksum_type = checksum_type
+        self.buffer = bytearray()
+
+    def write(self, chunk: bytes) -> None:
+        self.buffer += chunk
+        while len(self.buffer) >= bgcode.GCODE_BLOCK_SIZE:
+            self._flush(bgcode.GCODE_BLOCK_SIZE)
+
+    def close(self) -> None:
+        while self.buffer:
+            self._flush(bgcode.GCODE_BLOCK_SIZE)
+
+    def _flush(self, size: int) -> None:
+        payload = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        bgcode.write_block(self.stream, bgcode.BLOCK_GCODE, payload, self.compression,
+                           struct.pack("<H", bgcode.ENCODING_NONE), self.checksum_type)
+
+
+@contextmanager
+def _open_lines(src_path: str, input_format: str) -> Iterator[Iterator[str]]:
+    """
+    Открывает исходный G-code и отдаёт итератор его строк; файл закрывается
+    при выходе, в том числе если заголовок bgcode не прочитался.
+    """
+    if input_format == "bgcode":
+        with open(src_path, "rb") as src:
+            version, checksum_type = bgcode.read_file_header(src)
+            yield _split_lines(bgcode.iter_gcode_text(bgcode.iter_blocks(src, checksum_type)))
+    elif input_format == "gzip":
+        with gzip.open(src_path, "rt", encoding="utf-8", newline="") as src:
+            yield _iter_text_lines(src)
+    else:
+        with open(src_path, "r", encoding="utf-8", newline="") as src:
+            yield _iter_text_lines(src)
+
+
+@contextmanager
+def _replace_on_success(dst_path: str, mode_from: str) -> Iterator[BinaryIO]:
+    """
+    Пишет во временный файл рядом с dst_path и переименовывает его в dst_path
+    только при успехе (os.replace). При ошибке временный файл удаляется,
+    а dst_path остаётся нетронутым — в том числе если это и есть исходный файл.
+    """
+    directory = os.path.dirname(os.path.abspath(dst_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(dst_path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as dst:
+            yield dst
+        # mkstemp создаёт файл с правами 0600 — берём права исходного файла
+        shutil.copymode(mode_from, tmp_path)
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _transform_bgcode(
+        src_path: str,
+        dst: BinaryIO,
+        transform: Callable[[Iterable[str]], Iterable[str]],
+        compression: Optional[int]
+) -> None:
+    """
+    bgcode -> bgcode: метаданные и миниатюры копируются как есть,
+    G-code блоки распаковываются, преобразуются и упаковываются заново
+    (без MeatPack; сжатие — как у исходных блоков, если не задано иное).
+    """
+    with open(src_path, "rb") as src:
+        version, checksum_type = bgcode.read_file_header(src)
+        bgcode.write_file_header(dst, version, checksum_type)
+        blocks = bgcode.iter_blocks(src, checksum_type)
+
+        first_gcode = None
+        for block in blocks:
+            if block.type == bgcode.BLOCK_GCODE:
+                first_gcode = block
+                break
+            dst.write(block.raw)
+        if first_gcode is None:
+            return
+
+        def gcode_blocks():
+            yield first_gcode
+            for block in blocks:
+                if block.type != bgcode.BLOCK_GCODE:
+                    raise ValueError("Блоки метаданных после G-code не поддерживаются")
+                yield block
+
+        if compression is None:
+            compression = first_gcode.compression
+        if compression in (bgcode.COMPRESSION_HEATSHRINK_11_4, bgcode.COMPRESSION_HEATSHRINK_12_4) \
+                and not bgcode.HEATSHRINK_NATIVE and os.path.getsize(src_path) >= _SLOW_HEATSHRINK_SIZE:
+            warnings.warn(
+                "heatshrink кодируется на чистом Python (~0.7 МБ/с), обработка займёт минуты; "
+                "установите heatshrink2 (pip install heatshrink2) или выберите другое сжатие, "
+                "если прошивка принтера его поддерживает",
+                RuntimeWarning,
+                stacklevel=3,
+            )
+        block_writer = _GcodeBlockWriter(dst, compression, checksum_type)
+        lines = _split_lines(bgcode.iter_gcode_text(gcode_blocks()))
+        _pipelined(_join_chunks(transform(lines)), block_writer.write)
+        block_writer.close()
+
+
+def transform_gcode_file(
+        src_path: str,
+        dst_path: str,
+        transform: Callable[[Iterable[str]], Iterable[str]],
+        output_format: Optional[str] = None,
+        bgcode_compression: Optional[int] = None
+) -> str:
+    """
+    Потоково читает G-code (текст, gzip или bgcode — по magic-байтам),
+    пропускает строки через transform и пишет результат, не держа файл в памяти.
+    Результат пишется во временный файл в каталоге dst_path и заменяет его только
+    при успехе, поэтому dst_path может совпадать с src_path.
+
+    - output_format: "plain" / "gzip" / "bgcode"; по умолчанию — по расширению
+      dst_path, иначе как у исходного файла
+    - bgcode_compression: bgcode.COMPRESSION_*, по умолчанию как у исходных блоков.
+      Heatshrink кодируется через heatshrink2 (~9 МБ/с), без него — на чистом Python
+      (~0.7 МБ/с, для крупных файлов выдаётся RuntimeWarning)
+    Возвращает формат записанного файла.
+    """
+    input_format = detect_gcode_format(src_path)
+    output_format = output_format or format_from_extension(dst_path) or input_format
+    if output_format not in GCODE_FORMATS:
+        raise ValueError(f"Неизвестный формат G-code: {output_format}")
+
+    if output_format == "bgcode":
+        if input_format != "bgcode":
+            raise ValueError("Запись bgcode поддерживается только из исходного bgcode (нужны его метаданные)")
+        with _replace_on_success(dst_path, src_path) as dst:
+            _transform_bgcode(src_path, dst, transform, bgcode_compression)
+        return output_format
+
+    with _replace_on_success(dst_path, src_path) as raw, _open_lines(src_path, input_format) as lines:
+        if output_format == "gzip":
+            name = os.path.basename(dst_path)
+            with gzip.GzipFile(filename=name[:-3] if name.endswith(".gz") else name, mode="wb", fileobj=raw) as dst:
+                _pipelined(_join_chunks(transform(lines)), dst.write)
+        else:
+            _pipelined(_join_chunks(transform(lines)), raw.write)
+    return output_format
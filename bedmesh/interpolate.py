@@ -1,25 +1,66 @@
+from typing import Optional, Union
+
 import numpy as np
 from scipy.interpolate import RectBivariateSpline
 
+from bedmesh.klipper_mesh import KlipperZMesh
 from bedmesh.parse import SurfaceMesh
 
+INTERPOLATION_METHODS = ("spline", "klipper")
+
+# Сколько точек интерполятор считает за один вызов при заполнении сетки
+_BLOCK_POINTS = 1 << 16
 
-def _make_interpolator_grid(mesh: SurfaceMesh) -> RectBivariateSpline:
+
+def _make_interpolator_grid(mesh: SurfaceMesh, method: str = "spline") -> Union[RectBivariateSpline, KlipperZMesh]:
+    """
+    Строит интерполятор на основе SurfaceMesh.
+    - "spline": RectBivariateSpline (кубический сплайн scipy)
+    - "klipper": KlipperZMesh — та же таблица mesh_pps/algo/tension, что в прошивке
     """
-    Строит интерполятор RectBivariateSpline на основе SurfaceMesh.
+    if method == "spline":
+        return RectBivariateSpline(mesh.y, mesh.x, mesh.z, kx=3, ky=3)
+    if method == "klipper":
+        return KlipperZMesh(mesh)
+    raise ValueError(f"Неизвестный метод интерполяции: {method}")
+
+
+def _evaluate_grid(
+        interp: Union[RectBivariateSpline, KlipperZMesh],
+        y_new: np.ndarray,
+        x_new: np.ndarray,
+        dtype: Optional[np.dtype] = None,
+        out: Optional[np.ndarray] = None
+) -> np.ndarray:
     """
-    return RectBivariateSpline(mesh.y, mesh.x, mesh.z, kx=3, ky=3)
+    Заполняет сетку y_new × x_new блоками строк, чтобы временные массивы
+    интерполятора не превышали _BLOCK_POINTS точек; результат пишется сразу в out.
+    """
+    shape = (len(y_new), len(x_new))
+    if out is None:
+        out = np.empty(shape, dtype=dtype or np.float64)
+    elif out.shape != shape:
+        raise ValueError(f"Буфер out имеет форму {out.shape}, ожидается {shape}")
+
+    rows = max(1, _BLOCK_POINTS // max(1, len(x_new)))
+    for start in range(0, len(y_new), rows):
+        out[start:start + rows] = interp(y_new[start:start + rows], x_new)
+    return out
 
 
 def interpolate_surface(
         mesh: SurfaceMesh,
-        resolution: int = 50
+        resolution: int = 50,
+        method: str = "spline",
+        dtype: Optional[np.dtype] = None,
+        out: Optional[np.ndarray] = None
 ) -> SurfaceMesh:
     """
     Интерполяция внутри области bed_mesh (min..max).
     Использует безопасный метод .__call__().
+    dtype задаёт тип результата (например, np.float32), out — готовый буфер resolution × resolution.
     """
-    interp = _make_interpolator_grid(mesh)
+    interp = _make_interpolator_grid(mesh, method)
 
     x_min, x_max = float(np.min(mesh.x)), float(np.max(mesh.x))
     y_min, y_max = float(np.min(mesh.y)), float(np.max(mesh.y))
@@ -27,7 +68,7 @@ def interpolate_surface(
     x_new = np.linspace(x_min, x_max, resolution)
     y_new = np.linspace(y_min, y_max, resolution)
 
-    z_interp = interp(y_new, x_new)
+    z_interp = _evaluate_grid(interp, y_new, x_new, dtype, out)
     z_top = float(np.max(z_interp))
 
     return SurfaceMesh(x=x_new, y=y_new, z=z_interp, z_top=z_top)
@@ -36,13 +77,18 @@ def interpolate_surface(
 def interpolate_surface_with_extension(
         mesh: SurfaceMesh,
         resolution: int = 50,
-        edge_offset: float = 0.0
+        edge_offset: float = 0.0,
+        method: str = "spline",
+        dtype: Optional[np.dtype] = None,
+        out: Optional[np.ndarray] = None
 ) -> SurfaceMesh:
     """
     Интерполяция с экстраполяцией.
     Отступ edge_offset применяется от границ (0.0 .. full_extent) по X и Y.
+    В режиме "klipper" за границами сетки высота держится по краю, как в прошивке.
+    dtype и out — как в interpolate_surface.
     """
-    interp = _make_interpolator_grid(mesh)
+    interp = _make_interpolator_grid(mesh, method)
 
     extent_x = float(np.min(mesh.x)) + float(np.max(mesh.x))
     extent_y = float(np.min(mesh.y)) + float(np.max(mesh.y))
@@ -55,7 +101,7 @@ def interpolate_surface_with_extension(
     x_new = np.linspace(x_min, x_max, resolution)
     y_new = np.linspace(y_min, y_max, resolution)
 
-    z_interp = np.array([[interp.ev(y, x) for x in x_new] for y in y_new])
+    z_interp = _evaluate_grid(interp, y_new, x_new, dtype, out)
     z_top = float(np.max(z_interp))
 
     return SurfaceMesh(x=x_new, y=y_new, z=z_interp, z_top=z_top)
@@ -0,0 +1,197 @@
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+from bedmesh.parse import SurfaceMesh, _MeshMeta
+
+
+def _resolve_algo(meta: _MeshMeta, x_count: int, y_count: int) -> str:
+    """
+    Выбирает алгоритм так же, как это делает Klipper при загрузке профиля
+    (BedMeshCalibrate._verify_algorithm).
+    """
+    algo = meta.algo.lower()
+    if algo not in ("lagrange", "bicubic"):
+        raise ValueError(f"Неизвестный алгоритм интерполяции: {meta.algo}")
+
+    max_probe_cnt = max(x_count, y_count)
+    min_probe_cnt = min(x_count, y_count)
+    if max(meta.mesh_x_pps, meta.mesh_y_pps) == 0:
+        return "direct"
+    if algo == "lagrange" and max_probe_cnt > 6:
+        raise ValueError("Интерполяция lagrange не поддерживает более 6 точек по оси")
+    if algo == "bicubic" and min_probe_cnt < 4:
+        if max_probe_cnt > 6:
+            raise ValueError("Для bicubic требуется минимум 4 точки по каждой оси")
+        return "lagrange"
+    return algo
+
+
+def _interleave(probed: np.ndarray, inserted: np.ndarray) -> np.ndarray:
+    """
+    Собирает плотную строку: probed (..., n), inserted (..., n - 1, pps)
+    -> (..., (n - 1) * (pps + 1) + 1).
+    """
+    head = np.concatenate([probed[..., :-1, None], inserted], axis=-1)
+    head = head.reshape(probed.shape[:-1] + (-1,))
+    return np.concatenate([head, probed[..., -1:]], axis=-1)
+
+
+def _upsample_bicubic(z: np.ndarray, pps: int, tension: float) -> np.ndarray:
+    """
+    Кардинальный сплайн с натяжением по последней оси (_sample_bicubic в Klipper).
+    На краях крайняя точка дублируется как контрольная.
+    """
+    mult = pps + 1
+    t = np.arange(1, mult) / float(mult)
+    t2 = t * t
+    t3 = t2 * t
+
+    zp = np.concatenate([z[..., :1], z, z[..., -1:]], axis=-1)
+    p0 = zp[..., :-3, None]
+    p1 = zp[..., 1:-2, None]
+    p2 = zp[..., 2:-1, None]
+    p3 = zp[..., 3:, None]
+
+    m1 = tension * (p2 - p0)
+    m2 = tension * (p3 - p1)
+    inserted = (p1 * (2 * t3 - 3 * t2 + 1) +
+                p2 * (-2 * t3 + 3 * t2) +
+                m1 * (t3 - 2 * t2 + t) +
+                m2 * (t3 - t2))
+    return _interleave(z, inserted)
+
+
+def _upsample_lagrange(z: np.ndarray, pps: int, c_min: float, dist: float) -> np.ndarray:
+    """
+    Полином Лагранжа по всем точкам оси (_sample_lagrange в Klipper).
+    """
+    mult = pps + 1
+    n = z.shape[-1]
+    pts = c_min + dist * (np.arange(n) * mult)
+    dense = np.arange((n - 1) * mult + 1)
+    c = c_min + dist * dense[dense % mult != 0]
+
+    # basis[k, i] = prod_{j != i} (c_k - pts_j) / (pts_i - pts_j)
+    diff_c = c[:, None] - pts[None, :]
+    diff_p = pts[:, None] - pts[None, :]
+    np.fill_diagonal(diff_p, 1.0)
+    basis = np.empty((len(c), n))
+    for i in range(n):
+        others = np.arange(n) != i
+        basis[:, i] = np.prod(diff_c[:, others], axis=1) / np.prod(diff_p[i, others])
+
+    inserted = (z @ basis.T).reshape(z.shape[:-1] + (n - 1, pps))
+    return _interleave(z, inserted)
+
+
+class KlipperZMesh:
+    """
+    Повторяет ZMesh из Klipper: один раз строит плотную таблицу
+    (x_count - 1) * mesh_x_pps + x_count на (y_count - 1) * mesh_y_pps + y_count
+    тем же алгоритмом (lagrange / bicubic с tension), что и прошивка,
+    а z(x, y) вычисляет билинейной интерполяцией по этой таблице.
+    За пределами сетки значение ограничивается краем, как в calc_z.
+
+    Без параметров профиля (meta и mesh.meta равны None, например для уже
+    интерполированной сетки) таблица не строится: z считается напрямую по узлам
+    mesh (как algo "direct" при mesh_pps: 0), чтобы не интерполировать дважды.
+    """
+
+    def __init__(self, mesh: SurfaceMesh, meta: Optional[_MeshMeta] = None):
+        x_count = len(mesh.x)
+        y_count = len(mesh.y)
+        self.min_x, self.max_x = float(mesh.x[0]), float(mesh.x[-1])
+        self.min_y, self.max_y = float(mesh.y[0]), float(mesh.y[-1])
+
+        meta = meta or mesh.meta or _MeshMeta(
+            x_count=x_count, y_count=y_count,
+            min_x=self.min_x, max_x=self.max_x,
+            min_y=self.min_y, max_y=self.max_y,
+            mesh_x_pps=0, mesh_y_pps=0,
+        )
+        self.algo = _resolve_algo(meta, x_count, y_count)
+
+        if self.algo == "direct":
+            x_pps = y_pps = 0
+        else:
+            x_pps, y_pps = meta.mesh_x_pps, meta.mesh_y_pps
+
+        self.x_count = (x_count - 1) * x_pps + x_count
+        self.y_count = (y_count - 1) * y_pps + y_count
+        self.x_dist = (self.max_x - self.min_x) / (self.x_count - 1)
+        self.y_dist = (self.max_y - self.min_y) / (self.y_count - 1)
+
+        z = np.asarray(mesh.z, dtype=float)
+        if self.algo == "bicubic":
+            table = _upsample_bicubic(z, x_pps, meta.tension)
+            table = _upsample_bicubic(table.T, y_pps, meta.tension).T
+        elif self.algo == "lagrange":
+            table = _upsample_lagrange(z, x_pps, self.min_x, self.x_dist)
+            table = _upsample_lagrange(table.T, y_pps, self.min_y, self.y_dist).T
+        else:
+            table = z.copy()
+        self.table = np.ascontiguousarray(table)
+        # Копия таблицы списками для calc_z: индексация list быстрее, чем ndarray на скалярах
+        self._rows = self.table.tolist()
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.min_x + self.x_dist * np.arange(self.x_count)
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.min_y + self.y_dist * np.arange(self.y_count)
+
+    @staticmethod
+    def _linear_index(coord: np.ndarray, c_min: float, dist: float, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        idx = np.floor((coord - c_min) / dist).astype(np.intp)
+        idx = np.clip(idx, 0, count - 2)
+        t = np.clip((coord - (c_min + dist * idx)) / dist, 0.0, 1.0)
+        return t, idx
+
+    def ev(self, y, x) -> np.ndarray:
+        """
+        Значения z в точках (y[i], x[i]) — тот же порядок аргументов,
+        что у RectBivariateSpline.ev.
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        tx, ix = self._linear_index(x, self.min_x, self.x_dist, self.x_count)
+        ty, iy = self._linear_index(y, self.min_y, self.y_dist, self.y_count)
+        tbl = self.table
+        # lerp в той же форме, что в прошивке: (1 - t) * v0 + t * v1
+        z0 = (1.0 - tx) * tbl[iy, ix] + tx * tbl[iy, ix + 1]
+        z1 = (1.0 - tx) * tbl[iy + 1, ix] + tx * tbl[iy + 1, ix + 1]
+        return (1.0 - ty) * z0 + ty * z1
+
+    def __call__(self, y, x) -> np.ndarray:
+        """
+        Значения z на прямоугольной сетке y × x — тот же порядок аргументов
+        и форма результата, что у RectBivariateSpline.__call__.
+        """
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        y = np.atleast_1d(np.asarray(y, dtype=float))
+        return self.ev(y[:, None], x[None, :])
+
+    def calc_z(self, x: float, y: float) -> float:
+        """
+        z в одной точке без numpy — так же, как ZMesh.calc_z в прошивке.
+        Ограничения через сравнения: min/max заметно медленнее на скалярах.
+        """
+        ix = math.floor((x - self.min_x) / self.x_dist)
+        ix = 0 if ix < 0 else (self.x_count - 2 if ix > self.x_count - 2 else ix)
+        tx = (x - (self.min_x + self.x_dist * ix)) / self.x_dist
+        tx = 0.0 if tx < 0.0 else (1.0 if tx > 1.0 else tx)
+
+        iy = math.floor((y - self.min_y) / self.y_dist)
+        iy = 0 if iy < 0 else (self.y_count - 2 if iy > self.y_count - 2 else iy)
+        ty = (y - (self.min_y + self.y_dist * iy)) / self.y_dist
+        ty = 0.0 if ty < 0.0 else (1.0 if ty > 1.0 else ty)
+
+        row0 = self._rows[iy]
+        row1 = self._rows[iy + 1]
+        z0 = (1.0 - tx) * row0[ix] + tx * row0[ix + 1]
+        z1 = (1.0 - tx) * row1[ix] + tx * row1[ix + 1]
+        return (1.0 - ty) * z0 + ty * z1
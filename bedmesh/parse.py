@@ -1,16 +1,10 @@
 import re
 from dataclasses import dataclass
+from typing import Optional
 
 import numpy as np
 
 
-@dataclass
-class SurfaceMesh:
-    x: np.ndarray
-    y: np.ndarray
-    z: np.ndarray
-    z_top: float
-
 @dataclass
 class _MeshMeta:
     x_count: int
@@ -24,6 +18,16 @@ class _MeshMeta:
     algo: str = "bicubic"
     tension: float = 0.2
 
+@dataclass
+class SurfaceMesh:
+    x: np.ndarray
+    y: np.ndarray
+    z: np.ndarray
+    # None — не посчитан (после стадий, меняющих z на месте); тогда верх — max(z)
+    z_top: Optional[float] = None
+    # Параметры прошивки (mesh_pps, algo, tension); есть только у исходной сетки
+    meta: Optional[_MeshMeta] = None
+
 @dataclass
 class _BedMeshData:
     z_matrix: np.ndarray
@@ -103,4 +107,4 @@ def parse_bed_mesh(text: str) -> SurfaceMesh:
     y = np.linspace(meta.min_y, meta.max_y, meta.y_count)
     z_top = float(np.max(z_matrix))
 
-    return SurfaceMesh(x=x, y=y, z=z_matrix, z_top=z_top)
+    return SurfaceMesh(x=x, y=y, z=z_matrix, z_top=z_top, meta=meta)
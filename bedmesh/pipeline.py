@@ -0,0 +1,156 @@
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from bedmesh.apply_to_gcode import apply_bed_mesh_to_gcode, iter_bed_mesh_gcode
+from bedmesh.dome_deformation import apply_dome_compensation
+from bedmesh.gcode_io import transform_gcode_file
+from bedmesh.interpolate import interpolate_surface, interpolate_surface_with_extension
+from bedmesh.parse import SurfaceMesh, parse_bed_mesh
+from bedmesh.smooth import smooth_surface_laplacian_partial
+from bedmesh.stl_export import generate_stl_from_surface, generate_tiled_stl_from_surface
+
+Stage = Tuple[str, Callable[[SurfaceMesh], SurfaceMesh]]
+
+
+@dataclass
+class MeshPipeline:
+    """
+    Цепочка обработки parse → smooth → dome → interpolate → export/apply.
+
+    Стадии планируются один раз при создании. Сглаживание и купол работают
+    на месте в одном буфере исходной сетки (копия делается только для чужого
+    SurfaceMesh) и не пересчитывают z_top, интерполяция пишет сразу
+    в итоговый массив нужного dtype. Пиковая память — порядка одной итоговой сетки;
+    STL пишется потоково блоками строк (плюс фиксированный буфер блока, ~12 МБ).
+
+    - smooth_iterations / smooth_lambda: 0 итераций — без сглаживания; по умолчанию 1 для
+      "spline" и 0 для "klipper" (прошивка использует замеры как есть)
+    - dome_delta / dome_compensation: None — без компенсации купола
+    - resolution: None — без интерполяции (например, для method="klipper" в G-code)
+    - edge_offset: None — интерполяция внутри сетки, иначе с экстраполяцией до краёв стола
+    - method: "spline" или "klipper"; для "klipper" при применении к G-code стадия
+      интерполяции пропускается — z считается по таблице прошивки из исходной сетки
+    - dtype: np.float64 или np.float32
+    """
+    smooth_iterations: Optional[int] = None
+    smooth_lambda: float = 0.6
+    dome_delta: Optional[float] = None
+    dome_compensation: float = 1.0
+    resolution: Optional[int] = 50
+    edge_offset: Optional[float] = None
+    method: str = "spline"
+    dtype: np.dtype = np.float64
+    stages: List[Stage] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        if self.smooth_iterations is None:
+            self.smooth_iterations = 0 if self.method == "klipper" else 1
+        self.dtype = np.dtype(self.dtype)
+        self.stages = self._plan()
+
+    def _plan(self) -> List[Stage]:
+        stages: List[Stage] = []
+        if self.smooth_iterations > 0:
+            stages.append(("smooth", lambda mesh: smooth_surface_laplacian_partial(
+                mesh, iterations=self.smooth_iterations, lam=self.smooth_lambda, inplace=True)))
+        if self.dome_delta is not None:
+            stages.append(("dome", lambda mesh: apply_dome_compensation(
+                mesh, delta=self.dome_delta, compensation=self.dome_compensation, inplace=True)))
+        if self.resolution is not None:
+            if self.edge_offset is None:
+                stages.append(("interpolate", lambda mesh: interpolate_surface(
+                    mesh, self.resolution, self.method, dtype=self.dtype)))
+            else:
+                stages.append(("interpolate", lambda mesh: interpolate_surface_with_extension(
+                    mesh, self.resolution, self.edge_offset, self.method, dtype=self.dtype)))
+        return stages
+
+    def plan(self) -> List[str]:
+        return [name for name, _ in self.stages]
+
+    def _load(self, source: Union[str, SurfaceMesh]) -> SurfaceMesh:
+        if isinstance(source, str):
+            mesh = parse_bed_mesh(source)
+            # Массив только что создан парсером — приводим тип без лишней копии
+            mesh.z = mesh.z.astype(self.dtype, copy=False)
+            return mesh
+        # Чужую сетку не трогаем: одна копия z, дальше всё на месте
+        return SurfaceMesh(x=source.x, y=source.y, z=np.array(source.z, dtype=self.dtype), meta=source.meta)
+
+    def run(self, source: Union[str, SurfaceMesh]) -> SurfaceMesh:
+        """
+        Прогоняет текст bed_mesh или SurfaceMesh через все стадии.
+        """
+        return self._run(source, self.stages)
+
+    def _run(self, source: Union[str, SurfaceMesh], stages: List[Stage]) -> SurfaceMesh:
+        mesh = self._load(source)
+        for _, stage in stages:
+            mesh = stage(mesh)
+        return mesh
+
+    def _gcode_surface(self, source: Union[str, SurfaceMesh]) -> SurfaceMesh:
+        # KlipperZMesh строится по исходной сетке с параметрами профиля (mesh_pps, algo, tension);
+        # предварительная интерполяция дала бы второй, не совпадающий с прошивкой проход
+        if self.method == "klipper":
+            return self._run(source, [stage for stage in self.stages if stage[0] != "interpolate"])
+        return self.run(source)
+
+    def export_stl(self, source: Union[str, SurfaceMesh], output_path: str) -> str:
+        return generate_stl_from_surface(self.run(source), output_path)
+
+    def export_stl_tiles(
+            self,
+            source: Union[str, SurfaceMesh],
+            output_path: str,
+            tiles_x: int,
+            tiles_y: int,
+            overlap: float = 0.0,
+            single_file: bool = False,
+            max_workers: Optional[int] = None,
+            use_processes: bool = False
+    ) -> List[str]:
+        return generate_tiled_stl_from_surface(
+            self.run(source), output_path, tiles_x, tiles_y,
+            overlap=overlap, single_file=single_file, max_workers=max_workers, use_processes=use_processes,
+        )
+
+    def apply_to_gcode(
+            self,
+            source: Union[str, SurfaceMesh],
+            gcode_lines: List[str],
+            move_check_distance: float = 1.0,
+            split_delta_z: float = 0.01
+    ) -> List[str]:
+        return apply_bed_mesh_to_gcode(
+            gcode_lines,
+            self._gcode_surface(source),
+            move_check_distance=move_check_distance,
+            split_delta_z=split_delta_z,
+            method=self.method,
+        )
+
+    def apply_to_gcode_file(
+            self,
+            source: Union[str, SurfaceMesh],
+            gcode_path: str,
+            output_path: str,
+            move_check_distance: float = 1.0,
+            split_delta_z: float = 0.01,
+            output_format: Optional[str] = None,
+            bgcode_compression: Optional[int] = None
+    ) -> str:
+        """
+        Потоковая компенсация файла G-code (текст, .gcode.gz или .bgcode),
+        см. transform_gcode_file. Возвращает формат записанного файла.
+        """
+        surface = self._gcode_surface(source)
+        return transform_gcode_file(
+            gcode_path,
+            output_path,
+            lambda lines: iter_bed_mesh_gcode(lines, surface, move_check_distance, split_delta_z, self.method),
+            output_format=output_format,
+            bgcode_compression=bgcode_compression,
+        )
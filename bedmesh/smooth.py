@@ -3,7 +3,26 @@ import numpy as np
 from bedmesh.parse import SurfaceMesh
 
 
-def smooth_surface_laplacian(mesh: SurfaceMesh, iterations: int = 3) -> SurfaceMesh:
+def _neighbors_sum(z: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """
+    Сумма 4-х соседей для внутренней части z, записывается в out.
+    """
+    np.add(z[:-2, 1:-1], z[2:, 1:-1], out=out)
+    out += z[1:-1, :-2]
+    out += z[1:-1, 2:]
+    return out
+
+
+def _result_mesh(mesh: SurfaceMesh, z: np.ndarray, inplace: bool) -> SurfaceMesh:
+    if inplace:
+        mesh.z = z
+        mesh.z_top = None
+        return mesh
+    z_top = float(np.max(z))
+    return SurfaceMesh(x=mesh.x.copy(), y=mesh.y.copy(), z=z, z_top=z_top, meta=mesh.meta)
+
+
+def smooth_surface_laplacian(mesh: SurfaceMesh, iterations: int = 3, inplace: bool = False) -> SurfaceMesh:
     """
     Выполняет лапласово сглаживание поверхности: каждая точка z[i,j] заменяется
     на среднее арифметическое своих 4-х соседей (без учёта краёв).
@@ -11,25 +30,28 @@ def smooth_surface_laplacian(mesh: SurfaceMesh, iterations: int = 3) -> SurfaceM
     Параметры:
         mesh: SurfaceMesh — исходная поверхность
         iterations: int — число итераций сглаживания
+        inplace: bool — изменить mesh.z на месте, без копирования сетки
 
     Возвращает:
-        Новый SurfaceMesh со сглаженной матрицей z
+        SurfaceMesh со сглаженной матрицей z (новый, либо сам mesh при inplace)
     """
-    z = mesh.z.copy()
+    z = mesh.z if inplace else mesh.z.copy()
+    buf = np.empty_like(z[1:-1, 1:-1])
     for _ in range(iterations):
-        z_new = z.copy()
         # внутренняя часть
-        z_new[1:-1, 1:-1] = 0.25 * (
-                z[:-2, 1:-1] + z[2:, 1:-1] +
-                z[1:-1, :-2] + z[1:-1, 2:]
-        )
-        z = z_new
+        _neighbors_sum(z, buf)
+        buf *= 0.25
+        z[1:-1, 1:-1] = buf
 
-    z_top = float(np.max(z))
-    return SurfaceMesh(x=mesh.x.copy(), y=mesh.y.copy(), z=z, z_top=z_top)
+    return _result_mesh(mesh, z, inplace)
 
 
-def smooth_surface_laplacian_partial(mesh: SurfaceMesh, iterations: int = 3, lam: float = 0.4) -> SurfaceMesh:
+def smooth_surface_laplacian_partial(
+        mesh: SurfaceMesh,
+        iterations: int = 3,
+        lam: float = 0.4,
+        inplace: bool = False
+) -> SurfaceMesh:
     """
     Выполняет лапласово сглаживание с контролем силы (lambda ∈ [0,1]):
     z[i,j] := (1 - lambda) * z[i,j] + lambda * среднее 4-х соседей
@@ -38,19 +60,20 @@ def smooth_surface_laplacian_partial(mesh: SurfaceMesh, iterations: int = 3, lam
         mesh: SurfaceMesh — исходная поверхность
         iterations: int — число итераций сглаживания
         lam: float — сила сглаживания (lambda)
+        inplace: bool — изменить mesh.z на месте, без копирования сетки
 
     Возвращает:
-        Новый SurfaceMesh со сглаженной матрицей z
+        SurfaceMesh со сглаженной матрицей z (новый, либо сам mesh при inplace)
     """
-    z = mesh.z.copy()
+    z = mesh.z if inplace else mesh.z.copy()
+    buf = np.empty_like(z[1:-1, 1:-1])
     for _ in range(iterations):
-        neighbors_mean = 0.25 * (
-                z[:-2, 1:-1] + z[2:, 1:-1] +
-                z[1:-1, :-2] + z[1:-1, 2:]
-        )
-        z_new = z.copy()
-        z_new[1:-1, 1:-1] = (1 - lam) * z[1:-1, 1:-1] + lam * neighbors_mean
-        z = z_new
+        # buf считается целиком до записи во внутреннюю часть z
+        _neighbors_sum(z, buf)
+        buf *= 0.25
+        buf *= lam
+        inner = z[1:-1, 1:-1]
+        inner *= 1 - lam
+        inner += buf
 
-    z_top = float(np.max(z))
-    return SurfaceMesh(x=mesh.x.copy(), y=mesh.y.copy(), z=z, z_top=z_top)
+    return _result_mesh(mesh, z, inplace)
@@ -1,65 +1,241 @@
+import math
+import os
+import struct
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import BinaryIO, List, Optional, Tuple
+
 import numpy as np
-import trimesh
 
 from bedmesh.parse import SurfaceMesh
 
 
+def _surface_top(mesh: SurfaceMesh) -> float:
+    return mesh.z_top if mesh.z_top is not None else float(np.max(mesh.z))
+
+
+# Запись бинарного STL: 80 байт заголовка, число треугольников (u32),
+# затем по 50 байт на треугольник: нормаль и 3 вершины (float32), атрибут (u16)
+_STL_HEADER = b"bedmesh shim".ljust(80, b"\0")
+_STL_RECORD = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attr", "<u2")])
+
+# Сколько ячеек сетки обрабатывается за один блок строк
+_BLOCK_CELLS = 1 << 15
+
+
+def _boundary_edges(res_x: int, res_y: int) -> np.ndarray:
+    """
+    Рёбра контура (ix0, iy0, ix1, iy1): нижний и верхний край вперемешку,
+    затем левый и правый.
+    """
+    ix = np.arange(res_x - 1, dtype=np.int32)
+    iy = np.arange(res_y - 1, dtype=np.int32)
+    horizontal = np.stack([
+        np.stack([ix, np.zeros_like(ix), ix + 1, np.zeros_like(ix)], axis=-1),
+        np.stack([ix, np.full_like(ix, res_y - 1), ix + 1, np.full_like(ix, res_y - 1)], axis=-1),
+    ], axis=1).reshape(-1, 4)
+    vertical = np.stack([
+        np.stack([np.zeros_like(iy), iy, np.zeros_like(iy), iy + 1], axis=-1),
+        np.stack([np.full_like(iy, res_x - 1), iy, np.full_like(iy, res_x - 1), iy + 1], axis=-1),
+    ], axis=1).reshape(-1, 4)
+    return np.concatenate([horizontal, vertical])
+
+
+def shim_triangle_count(mesh: SurfaceMesh) -> int:
+    """
+    Число треугольников замкнутой прокладки: низ и верх по 2 на ячейку,
+    по 2 на каждое ребро контура.
+    """
+    res_x, res_y = len(mesh.x), len(mesh.y)
+    return 4 * (res_x - 1) * (res_y - 1) + 4 * ((res_x - 1) + (res_y - 1))
+
+
+def _fill_normals(records: np.ndarray) -> None:
+    v = records["vertices"].astype(np.float64)
+    normal = np.cross(v[..., 1, :] - v[..., 0, :], v[..., 2, :] - v[..., 0, :])
+    length = np.linalg.norm(normal, axis=-1, keepdims=True)
+    np.divide(normal, length, out=normal, where=length > 0)
+    records["normal"] = normal
+
+
+def _set_triangle(records: np.ndarray, tri: int, corners) -> None:
+    for k, (cx, cy, cz) in enumerate(corners):
+        v = records["vertices"][..., tri, k, :]
+        v[..., 0] = cx
+        v[..., 1] = cy
+        v[..., 2] = cz
+
+
+def _surface_block(mesh: SurfaceMesh, z_top: float, r0: int, r1: int, top: bool) -> np.ndarray:
+    """
+    Треугольники ячеек строк r0..r1-1 для нижней (по z) или верхней (z_top) поверхности,
+    в порядке обхода iy, ix — по 2 на ячейку.
+    """
+    x0, x1 = mesh.x[None, :-1], mesh.x[None, 1:]
+    y0, y1 = mesh.y[r0:r1, None], mesh.y[r0 + 1:r1 + 1, None]
+    records = np.zeros((r1 - r0, len(mesh.x) - 1, 2), dtype=_STL_RECORD)
+    if top:
+        i0, i1, i2, i3 = (x0, y0, z_top), (x1, y0, z_top), (x0, y1, z_top), (x1, y1, z_top)
+        _set_triangle(records, 0, (i0, i1, i2))
+        _set_triangle(records, 1, (i1, i3, i2))
+    else:
+        z = mesh.z
+        i0 = (x0, y0, z[r0:r1, :-1])
+        i1 = (x1, y0, z[r0:r1, 1:])
+        i2 = (x0, y1, z[r0 + 1:r1 + 1, :-1])
+        i3 = (x1, y1, z[r0 + 1:r1 + 1, 1:])
+        _set_triangle(records, 0, (i0, i2, i1))
+        _set_triangle(records, 1, (i1, i2, i3))
+    _fill_normals(records)
+    return records
+
+
+def _side_records(mesh: SurfaceMesh, z_top: float) -> np.ndarray:
+    """
+    Боковые стенки: по 2 треугольника на каждое ребро контура.
+    """
+    ix0, iy0, ix1, iy1 = _boundary_edges(len(mesh.x), len(mesh.y)).T
+    p0 = (mesh.x[ix0], mesh.y[iy0], mesh.z[iy0, ix0])
+    p1 = (mesh.x[ix1], mesh.y[iy1], mesh.z[iy1, ix1])
+    p2 = (mesh.x[ix0], mesh.y[iy0], z_top)
+    p3 = (mesh.x[ix1], mesh.y[iy1], z_top)
+    records = np.zeros((len(ix0), 2), dtype=_STL_RECORD)
+    _set_triangle(records, 0, (p0, p1, p2))
+    _set_triangle(records, 1, (p1, p3, p2))
+    _fill_normals(records)
+    return records
+
+
+def write_shim_triangles(stream: BinaryIO, mesh: SurfaceMesh, z_top: Optional[float] = None) -> None:
+    """
+    Пишет треугольники прокладки (без заголовка STL) блоками строк:
+    сначала низ, затем верх, затем боковые стенки. Память — O(блока), а не всей модели.
+    """
+    if z_top is None:
+        z_top = _surface_top(mesh)
+    rows = max(1, _BLOCK_CELLS // max(1, len(mesh.x) - 1))
+    for top in (False, True):
+        for r0 in range(0, len(mesh.y) - 1, rows):
+            r1 = min(r0 + rows, len(mesh.y) - 1)
+            stream.write(_surface_block(mesh, z_top, r0, r1, top).tobytes())
+    stream.write(_side_records(mesh, z_top).tobytes())
+
+
+def _write_stl_header(stream: BinaryIO, triangles: int) -> None:
+    stream.write(_STL_HEADER + struct.pack("<I", triangles))
+
+
 def generate_stl_from_surface(mesh: SurfaceMesh, output_path: str) -> str:
     """
     Строит STL из сетки координат и матрицы высот.
     - mesh: объект SurfaceMesh с полями x, y, z, z_top
     - output_path: путь для сохранения STL
+    Бинарный STL пишется потоково, без промежуточной модели в памяти.
     """
-    x_new = mesh.x
-    y_new = mesh.y
-    z_interp = mesh.z
-    z_top = mesh.z_top
-
-    res_x = len(x_new)
-    res_y = len(y_new)
-    resolution = res_x  # предполагаем квадратную сетку
-
-    # Вершины
-    vertices_bottom = [[x, y, z_interp[iy, ix]] for iy, y in enumerate(y_new) for ix, x in enumerate(x_new)]
-    vertices_top = [[x, y, z_top] for iy, y in enumerate(y_new) for ix, x in enumerate(x_new)]
-    offset_top = len(vertices_bottom)
-
-    # Грани
-    faces_bottom, faces_top = [], []
-    for iy in range(resolution - 1):
-        for ix in range(resolution - 1):
-            i0 = iy * resolution + ix
-            i1 = i0 + 1
-            i2 = i0 + resolution
-            i3 = i2 + 1
-            faces_bottom += [[i0, i2, i1], [i1, i2, i3]]
-            faces_top += [[i0 + offset_top, i1 + offset_top, i2 + offset_top],
-                          [i1 + offset_top, i3 + offset_top, i2 + offset_top]]
-
-    # Боковые стенки
-    vertices_sides = []
-    faces_sides = []
-
-    def add_side(v0, v1, base_index):
-        z0 = z_interp[v0[1], v0[0]]
-        z1 = z_interp[v1[1], v1[0]]
-        p0 = [x_new[v0[0]], y_new[v0[1]], z0]
-        p1 = [x_new[v1[0]], y_new[v1[1]], z1]
-        p2 = [x_new[v0[0]], y_new[v0[1]], z_top]
-        p3 = [x_new[v1[0]], y_new[v1[1]], z_top]
-        idx = base_index + len(vertices_sides)
-        vertices_sides.extend([p0, p1, p2, p3])
-        faces_sides.extend([[idx, idx + 1, idx + 2], [idx + 1, idx + 3, idx + 2]])
-
-    for ix in range(resolution - 1):
-        add_side((ix, 0), (ix + 1, 0), offset_top * 2)
-        add_side((ix, resolution - 1), (ix + 1, resolution - 1), offset_top * 2)
-    for iy in range(resolution - 1):
-        add_side((0, iy), (0, iy + 1), offset_top * 2)
-        add_side((resolution - 1, iy), (resolution - 1, iy + 1), offset_top * 2)
-
-    vertices = np.array(vertices_bottom + vertices_top + vertices_sides)
-    faces = faces_bottom + faces_top + faces_sides
-    mesh = trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
-    mesh.export(output_path)
+    with open(output_path, "wb") as f:
+        _write_stl_header(f, shim_triangle_count(mesh))
+        write_shim_triangles(f, mesh)
     return output_path
+
+
+def _tile_bounds(count: int, tiles: int, overlap_points: int) -> List[Tuple[int, int]]:
+    """
+    Делит индексы 0..count-1 на tiles отрезков [start, stop) с общей граничной линией,
+    каждый расширен на overlap_points узлов в сторону соседей.
+    """
+    edges = np.linspace(0, count - 1, tiles + 1).round().astype(int)
+    if np.any(np.diff(edges) < 1):
+        raise ValueError(f"Сетка из {count} точек слишком мала для {tiles} частей")
+    return [(max(0, int(a) - overlap_points), min(count, int(b) + 1 + overlap_points))
+            for a, b in zip(edges[:-1], edges[1:])]
+
+
+def _overlap_points(overlap: float, coords: np.ndarray) -> int:
+    """
+    Перекрытие overlap (мм) в узлах сетки coords; 0 для сетки из одного узла.
+    """
+    step = (coords[-1] - coords[0]) / max(1, len(coords) - 1)
+    if overlap <= 0 or step <= 0:
+        return 0
+    return math.ceil(overlap / step)
+
+
+def split_surface_into_tiles(
+        mesh: SurfaceMesh,
+        tiles_x: int,
+        tiles_y: int,
+        overlap: float = 0.0
+) -> List[List[SurfaceMesh]]:
+    """
+    Режет SurfaceMesh на сетку tiles_y × tiles_x частей (без копирования z).
+    Соседние части имеют общую линию узлов; overlap (мм) дополнительно
+    расширяет каждую часть в сторону соседей, округляя до шага сетки.
+    У всех частей общий z_top, чтобы верх собранной прокладки был ровным.
+    """
+    if tiles_x < 1 or tiles_y < 1:
+        raise ValueError(f"Число частей должно быть не меньше 1: {tiles_x}×{tiles_y}")
+    bounds_x = _tile_bounds(len(mesh.x), tiles_x, _overlap_points(overlap, mesh.x))
+    bounds_y = _tile_bounds(len(mesh.y), tiles_y, _overlap_points(overlap, mesh.y))
+
+    z_top = _surface_top(mesh)
+    return [[SurfaceMesh(x=mesh.x[x0:x1], y=mesh.y[y0:y1], z=mesh.z[y0:y1, x0:x1], z_top=z_top)
+             for x0, x1 in bounds_x]
+            for y0, y1 in bounds_y]
+
+
+def _tile_path(output_path: str, iy: int, ix: int) -> str:
+    root, ext = os.path.splitext(output_path)
+    return f"{root}_{iy}_{ix}{ext or '.stl'}"
+
+
+def _write_tile_at(tile: SurfaceMesh, output_path: str, offset: int) -> None:
+    with open(output_path, "r+b") as f:
+        f.seek(offset)
+        write_shim_triangles(f, tile)
+
+
+def generate_tiled_stl_from_surface(
+        mesh: SurfaceMesh,
+        output_path: str,
+        tiles_x: int,
+        tiles_y: int,
+        overlap: float = 0.0,
+        single_file: bool = False,
+        max_workers: Optional[int] = None,
+        use_processes: bool = False
+) -> List[str]:
+    """
+    Строит прокладку из tiles_x × tiles_y частей параллельно.
+    - output_path: для отдельных файлов к имени добавляется _<ряд>_<столбец>
+      (shim.stl -> shim_0_0.stl, shim_0_1.stl, ...)
+    - overlap: перекрытие частей (мм)
+    - single_file: записать все части одним многотельным файлом output_path
+    - max_workers / use_processes: размер и тип пула (потоки или процессы).
+      Потоков обычно достаточно: запись идёт блоками, почти всё время уходит
+      на операции numpy и write(), которые отпускают GIL. Процессы имеют смысл
+      при многих ядрах и крупных частях — каждая часть копируется в процесс
+      (pickle), поэтому на малых сетках они медленнее потоков.
+    Возвращает список записанных файлов.
+    """
+    tiles = [(iy, ix, tile)
+             for iy, row in enumerate(split_surface_into_tiles(mesh, tiles_x, tiles_y, overlap))
+             for ix, tile in enumerate(row)]
+
+    if single_file:
+        # Размер каждой части известен заранее — части пишутся параллельно по своим смещениям
+        counts = [shim_triangle_count(tile) for _, _, tile in tiles]
+        offsets = np.cumsum([0] + counts[:-1]) * _STL_RECORD.itemsize + len(_STL_HEADER) + 4
+        with open(output_path, "wb") as f:
+            _write_stl_header(f, sum(counts))
+            f.truncate(int(offsets[-1]) + counts[-1] * _STL_RECORD.itemsize)
+
+    pool: Executor = ProcessPoolExecutor(max_workers) if use_processes else ThreadPoolExecutor(max_workers)
+    with pool:
+        if not single_file:
+            return list(pool.map(generate_stl_from_surface,
+                                 [tile for _, _, tile in tiles],
+                                 [_tile_path(output_path, iy, ix) for iy, ix, _ in tiles]))
+        list(pool.map(_write_tile_at,
+                      [tile for _, _, tile in tiles],
+                      [output_path] * len(tiles),
+                      [int(offset) for offset in offsets]))
+    return [output_path]
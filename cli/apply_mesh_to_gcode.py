@@ -1,40 +1,63 @@
 import argparse
-from pathlib import Path
-from bedmesh.parse import parse_bed_mesh
-from bedmesh.smooth import smooth_surface_laplacian_partial
-from bedmesh.interpolate import interpolate_surface_with_extension
-from bedmesh.apply_to_gcode import apply_bed_mesh_to_gcode
+
+import numpy as np
+
+from bedmesh.bgcode import COMPRESSION_NAMES
+from bedmesh.gcode_io import GCODE_FORMATS
+from bedmesh.interpolate import INTERPOLATION_METHODS
+from bedmesh.pipeline import MeshPipeline
 
 def main():
     parser = argparse.ArgumentParser(description="Apply bed mesh compensation to G-code file.")
     parser.add_argument("--mesh", required=True, help="Path to bed mesh text file.")
-    parser.add_argument("--gcode", required=True, help="Path to input G-code file.")
+    parser.add_argument("--gcode", required=True, help="Path to input G-code file (plain, .gcode.gz or .bgcode).")
     parser.add_argument("--out", required=True, help="Path to output G-code file.")
+    parser.add_argument("--out-format", choices=GCODE_FORMATS, default=None,
+                        help="Output format. Default: from --out extension, otherwise same as input.")
+    parser.add_argument("--bgcode-compression", choices=COMPRESSION_NAMES, default=None,
+                        help="Compression of G-code blocks in .bgcode output. Default: same as input "
+                             "(PrusaSlicer writes heatshrink12). heatshrink uses the compiled heatshrink2 package "
+                             "when installed (~9 MB/s), otherwise a pure-Python codec (~0.7 MB/s, minutes for "
+                             "a large print). deflate is faster still, but Prusa firmware must accept "
+                             "deflate-compressed G-code blocks: check that your printer does before using it.")
     parser.add_argument("--move-check-distance", type=float, default=5.0, help="Max XY distance between compensation points.")
     parser.add_argument("--split-delta-z", type=float, default=0.01, help="Max Z difference to keep segments combined.")
-    parser.add_argument("--smooth-iterations", type=int, default=1, help="How many smoothing passes to apply.")
+    parser.add_argument("--smooth-iterations", type=int, default=None,
+                        help="How many smoothing passes to apply. Default: 1 for spline, "
+                             "0 for klipper (the firmware uses the probed points as-is).")
     parser.add_argument("--smooth-lambda", type=float, default=0.6, help="Smoothing factor (lambda).")
     parser.add_argument("--resolution", type=int, default=100, help="Interpolation resolution.")
+    parser.add_argument("--interpolation", choices=INTERPOLATION_METHODS, default="spline",
+                        help="Interpolation method: scipy spline or Klipper-compatible (mesh_pps, algo, tension). "
+                             "klipper disables smoothing unless --smooth-iterations is given.")
+    parser.add_argument("--float32", action="store_true", help="Process the mesh in float32 to halve memory use.")
 
     args = parser.parse_args()
 
     with open(args.mesh, "r") as f:
         mesh_text = f.read()
 
-    surface = parse_bed_mesh(mesh_text)
-    surface = smooth_surface_laplacian_partial(surface, iterations=args.smooth_iterations, lam=args.smooth_lambda)
-    surface = interpolate_surface_with_extension(surface, resolution=args.resolution, edge_offset=0)
+    pipeline = MeshPipeline(
+        # None — по умолчанию для метода: 1 для spline, 0 для klipper
+        smooth_iterations=args.smooth_iterations,
+        smooth_lambda=args.smooth_lambda,
+        # Klipper-режим интерполирует по собственной таблице прошивки
+        resolution=args.resolution if args.interpolation == "spline" else None,
+        edge_offset=0,
+        method=args.interpolation,
+        dtype=np.float32 if args.float32 else np.float64,
+    )
 
-    gcode_lines = Path(args.gcode).read_text(encoding="utf-8").splitlines()
-    compensated_lines = apply_bed_mesh_to_gcode(
-        gcode_lines,
-        surface,
+    out_format = pipeline.apply_to_gcode_file(
+        mesh_text,
+        args.gcode,
+        args.out,
         move_check_distance=args.move_check_distance,
         split_delta_z=args.split_delta_z,
+        output_format=args.out_format,
+        bgcode_compression=None if args.bgcode_compression is None else COMPRESSION_NAMES[args.bgcode_compression],
     )
-
-    Path(args.out).write_text("\n".join(compensated_lines) + "\n", encoding="utf-8")
-    print(f"G-code saved to {args.out}")
+    print(f"G-code ({out_format}) saved to {args.out}")
 
 if __name__ == "__main__":
     main()
@@ -1,17 +1,15 @@
 # import sys
 # sys.path.append("/mnt/data")
 
-from bedmesh.interpolate import interpolate_surface
-from bedmesh.parse import parse_bed_mesh
-from bedmesh.smooth import smooth_surface_laplacian_partial
-from bedmesh.stl_export import generate_stl_from_surface
+from typing import Optional
 
+from bedmesh.pipeline import MeshPipeline
 
-def generate_stl_from_bed_mesh_text(text: str, resolution: int = 50, output_path: str = "bed_mesh_model.stl") -> str:
-    mesh = parse_bed_mesh(text)
-    mesh = smooth_surface_laplacian_partial(mesh, iterations=1, lam=0.6)
-    mesh = interpolate_surface(mesh, resolution)
-    return generate_stl_from_surface(mesh, output_path)
+
+def generate_stl_from_bed_mesh_text(text: str, resolution: int = 50, output_path: str = "bed_mesh_model.stl", method: str = "spline", smooth_iterations: Optional[int] = None) -> str:
+    # smooth_iterations=None: 1 для spline, 0 для klipper (прошивка использует замеры как есть)
+    pipeline = MeshPipeline(smooth_iterations=smooth_iterations, smooth_lambda=0.6, resolution=resolution, method=method)
+    return pipeline.export_stl(text, output_path)
 
 
 if __name__ == "__main__":
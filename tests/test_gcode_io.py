@@ -0,0 +1,236 @@
+import gc
+import gzip
+import io
+import os
+import struct
+import tempfile
+import unittest
+import warnings
+from unittest import mock
+
+import numpy as np
+
+from bedmesh import bgcode
+from bedmesh.apply_to_gcode import apply_bed_mesh_to_gcode, iter_bed_mesh_gcode
+from bedmesh import gcode_io
+from bedmesh.gcode_io import detect_gcode_format, transform_gcode_file
+from bedmesh.parse import SurfaceMesh
+
+GCODE = "\n".join(
+    ["; header", "G28", "M104 S200", "G1 X0 Y0 Z0.2 E0.0 F1800"] +
+    [f"G1 X{10 + i % 50} Y{20 + i % 30} E{i * 0.01:.3f}" for i in range(3000)]
+) + "\n"
+
+
+def _make_surface():
+    x = np.linspace(0.0, 100.0, 5)
+    z = 0.001 * np.add.outer(x, x)
+    return SurfaceMesh(x=x, y=x, z=z)
+
+
+def _write_bgcode(path, text, compression):
+    with open(path, "wb") as f:
+        bgcode.write_file_header(f)
+        encoding = struct.pack("<H", bgcode.ENCODING_NONE)
+        bgcode.write_block(f, bgcode.BLOCK_FILE_METADATA, b"Producer=test\n", bgcode.COMPRESSION_NONE,
+                           encoding, bgcode.CHECKSUM_CRC32)
+        bgcode.write_block(f, bgcode.BLOCK_THUMBNAIL, b"\x89PNG fake", bgcode.COMPRESSION_NONE,
+                           struct.pack("<HHH", 0, 16, 16), bgcode.CHECKSUM_CRC32)
+        data = text.encode("utf-8")
+        for start in range(0, len(data), 4096):
+            bgcode.write_block(f, bgcode.BLOCK_GCODE, data[start:start + 4096], compression,
+                               encoding, bgcode.CHECKSUM_CRC32)
+
+
+def _read_bgcode(path):
+    with open(path, "rb") as f:
+        _, checksum_type = bgcode.read_file_header(f)
+        return list(bgcode.iter_blocks(f, checksum_type))
+
+
+class TestBgcodeCodecs(unittest.TestCase):
+    def test_heatshrink_roundtrip(self):
+        data = GCODE.encode("utf-8")[:20000] + bytes(range(256)) + b"a" * 100
+        for window, lookahead in ((11, 4), (12, 4)):
+            packed = bgcode.heatshrink_encode(data, window, lookahead)
+            self.assertLess(len(packed), len(data))
+            self.assertEqual(bgcode.heatshrink_decode(packed, window, lookahead), data)
+
+    def test_heatshrink_known_vectors(self):
+        # Эталон — вывод C-библиотеки heatshrink (heatshrink2) с lookahead 4
+        data = b"abcabcabcabcabcabc"
+        self.assertEqual(bgcode.heatshrink_encode(data, 11, 4), bytes.fromhex("b0d8ac6005c0"))
+        self.assertEqual(bgcode.heatshrink_encode(data, 12, 4), bytes.fromhex("b0d8ac6002e0"))
+        gcode = b"G1 X10 Y20 E0.5\nG1 X10 Y20 E0.6\nG1 X10 Y20 E0.7\n"
+        for window, packed in ((11, "a3cc6415898cc24159994c24145984ba6b0a00fd9b007f4de140"),
+                               (12, "a3cc6415898cc24159994c24145984ba6b0a007ecd801fd37850")):
+            self.assertEqual(bgcode.heatshrink_decode(bytes.fromhex(packed), window, 4), gcode)
+
+    @unittest.skipUnless(bgcode.HEATSHRINK_NATIVE, "heatshrink2 не установлен")
+    def test_native_and_python_codecs_interoperate(self):
+        data = GCODE.encode("utf-8")[:30000]
+        for compression in (bgcode.COMPRESSION_HEATSHRINK_11_4, bgcode.COMPRESSION_HEATSHRINK_12_4):
+            window, lookahead = (11, 4) if compression == bgcode.COMPRESSION_HEATSHRINK_11_4 else (12, 4)
+            native = bgcode.compress(data, compression)
+            self.assertEqual(bgcode.heatshrink_decode(native, window, lookahead), data)
+            python = bgcode.heatshrink_encode(data, window, lookahead)
+            self.assertEqual(bgcode.decompress(python, compression, len(data)), data)
+
+    def test_meatpack_decode(self):
+        enable = b"\xff\xff\xfb"
+        self.assertEqual(bgcode.meatpack_decode(enable + b"\x1d\xeb\xc1"), "G1 X1\n")
+        # 'Y' и 'M' нет в таблице — передаются отдельным байтом
+        self.assertEqual(bgcode.meatpack_decode(enable + b"\x1d\xfbY\xc5\x1fM\x0c"), "G1 Y5\nM1\n")
+        # Режим без пробелов: 0b1011 — 'E', пробелы восстанавливаются
+        self.assertEqual(bgcode.meatpack_decode(enable + b"\xff\xff\xf7\x1d\x1e\x2b\x0c"), "G1 X1 E2\n")
+
+
+class TestGcodeStreaming(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.surface = _make_surface()
+        self.expected = "\n".join(apply_bed_mesh_to_gcode(GCODE.splitlines(), self.surface)) + "\n"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def _transform(self, lines):
+        return iter_bed_mesh_gcode(lines, self.surface)
+
+    def test_plain(self):
+        with open(self._path("in.gcode"), "w", encoding="utf-8") as f:
+            f.write(GCODE)
+        fmt = transform_gcode_file(self._path("in.gcode"), self._path("out.gcode"), self._transform)
+        self.assertEqual(fmt, "plain")
+        with open(self._path("out.gcode"), encoding="utf-8") as f:
+            self.assertEqual(f.read(), self.expected)
+
+    def test_gzip(self):
+        with gzip.open(self._path("job.gcode.gz"), "wt", encoding="utf-8") as f:
+            f.write(GCODE)
+        # Расширение не совпадает с форматом — определяется по magic-байтам
+        os.rename(self._path("job.gcode.gz"), self._path("job.bin"))
+        self.assertEqual(detect_gcode_format(self._path("job.bin")), "gzip")
+
+        fmt = transform_gcode_file(self._path("job.bin"), self._path("out.bin"), self._transform)
+        self.assertEqual(fmt, "gzip")
+        with gzip.open(self._path("out.bin"), "rt", encoding="utf-8") as f:
+            self.assertEqual(f.read(), self.expected)
+
+    def test_bgcode(self):
+        for compression in (bgcode.COMPRESSION_NONE, bgcode.COMPRESSION_DEFLATE, bgcode.COMPRESSION_HEATSHRINK_12_4):
+            _write_bgcode(self._path("in.bgcode"), GCODE, compression)
+            self.assertEqual(detect_gcode_format(self._path("in.bgcode")), "bgcode")
+
+            transform_gcode_file(self._path("in.bgcode"), self._path("out.bgcode"), self._transform)
+            source, result = _read_bgcode(self._path("in.bgcode")), _read_bgcode(self._path("out.bgcode"))
+            self.assertEqual([b.raw for b in result[:2]], [b.raw for b in source[:2]])
+            self.assertTrue(all(b.compression == compression for b in result[2:]))
+            self.assertEqual("".join(bgcode.iter_gcode_text(result)), self.expected)
+
+            transform_gcode_file(self._path("in.bgcode"), self._path("out.gcode"), self._transform)
+            with open(self._path("out.gcode"), encoding="utf-8") as f:
+                self.assertEqual(f.read(), self.expected)
+
+    def test_in_place(self):
+        with gzip.open(self._path("job.gcode.gz"), "wt", encoding="utf-8") as f:
+            f.write(GCODE)
+        _write_bgcode(self._path("job.bgcode"), GCODE, bgcode.COMPRESSION_DEFLATE)
+        with open(self._path("job.gcode"), "w", encoding="utf-8") as f:
+            f.write(GCODE)
+
+        for name in ("job.gcode", "job.gcode.gz", "job.bgcode"):
+            transform_gcode_file(self._path(name), self._path(name), self._transform)
+        with open(self._path("job.gcode"), encoding="utf-8") as f:
+            self.assertEqual(f.read(), self.expected)
+        with gzip.open(self._path("job.gcode.gz"), "rt", encoding="utf-8") as f:
+            self.assertEqual(f.read(), self.expected)
+        self.assertEqual("".join(bgcode.iter_gcode_text(_read_bgcode(self._path("job.bgcode")))), self.expected)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["job.bgcode", "job.gcode", "job.gcode.gz"])
+
+    def test_error_keeps_destination(self):
+        def failing(lines):
+            for i, line in enumerate(self._transform(lines)):
+                if i == 2000:
+                    raise RuntimeError("boom")
+                yield line
+
+        with open(self._path("in.gcode"), "w", encoding="utf-8") as f:
+            f.write(GCODE)
+        _write_bgcode(self._path("in.bgcode"), GCODE, bgcode.COMPRESSION_NONE)
+        for src, dst in (("in.gcode", "out.gcode"), ("in.gcode", "out.gcode.gz"), ("in.bgcode", "out.bgcode"),
+                         ("in.gcode", "in.gcode")):
+            if dst != src:
+                with open(self._path(dst), "wb") as f:
+                    f.write(b"previous")
+            before = self._snapshot()
+            with self.assertRaises(RuntimeError):
+                transform_gcode_file(self._path(src), self._path(dst), failing)
+            # Ни частичного результата, ни временных файлов
+            self.assertEqual(self._snapshot(), before)
+
+    def test_source_closed_on_error(self):
+        with open(self._path("in.gcode"), "w", encoding="utf-8") as f:
+            f.write(GCODE)
+        _write_bgcode(self._path("full.bgcode"), GCODE, bgcode.COMPRESSION_NONE)
+        with open(self._path("full.bgcode"), "rb") as f:
+            head = f.read(6)
+        with open(self._path("cut.bgcode"), "wb") as f:
+            f.write(head)
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always", ResourceWarning)
+            with self.assertRaises(FileNotFoundError):
+                transform_gcode_file(self._path("in.gcode"), self._path("missing/out.gcode"), self._transform)
+            with self.assertRaises(ValueError):
+                transform_gcode_file(self._path("cut.bgcode"), self._path("out.gcode"), self._transform)
+            gc.collect()
+        self.assertEqual([w for w in caught if issubclass(w.category, ResourceWarning)], [])
+        self.assertFalse(os.path.exists(self._path("out.gcode")))
+
+    def _snapshot(self):
+        result = {}
+        for name in os.listdir(self.tmp.name):
+            with open(self._path(name), "rb") as f:
+                result[name] = f.read()
+        return result
+
+    def test_bgcode_compression_override(self):
+        _write_bgcode(self._path("in.bgcode"), GCODE, bgcode.COMPRESSION_HEATSHRINK_12_4)
+        transform_gcode_file(self._path("in.bgcode"), self._path("out.bgcode"), self._transform,
+                             bgcode_compression=bgcode.COMPRESSION_DEFLATE)
+        result = _read_bgcode(self._path("out.bgcode"))
+        self.assertTrue(all(b.compression == bgcode.COMPRESSION_DEFLATE for b in result[2:]))
+        self.assertEqual("".join(bgcode.iter_gcode_text(result)), self.expected)
+
+    def test_slow_heatshrink_warning(self):
+        _write_bgcode(self._path("in.bgcode"), GCODE, bgcode.COMPRESSION_HEATSHRINK_12_4)
+        with mock.patch.object(gcode_io, "_SLOW_HEATSHRINK_SIZE", 0):
+            with mock.patch.object(bgcode, "HEATSHRINK_NATIVE", False):
+                with self.assertWarns(RuntimeWarning):
+                    transform_gcode_file(self._path("in.bgcode"), self._path("out.bgcode"), self._transform)
+                self.assertEqual("".join(bgcode.iter_gcode_text(_read_bgcode(self._path("out.bgcode")))),
+                                 self.expected)
+            with warnings.catch_warnings():
+                warnings.simplefilter("error", RuntimeWarning)
+                transform_gcode_file(self._path("in.bgcode"), self._path("out.bgcode"), self._transform,
+                                     bgcode_compression=bgcode.COMPRESSION_DEFLATE)
+
+    def test_bgcode_output_requires_bgcode_input(self):
+        with open(self._path("in.gcode"), "w", encoding="utf-8") as f:
+            f.write(GCODE)
+        with self.assertRaises(ValueError):
+            transform_gcode_file(self._path("in.gcode"), self._path("out.bgcode"), self._transform)
+
+    def test_bad_checksum(self):
+        _write_bgcode(self._path("in.bgcode"), "G28\n", bgcode.COMPRESSION_NONE)
+        with open(self._path("in.bgcode"), "rb") as f:
+            data = bytearray(f.read())
+        data[-5] ^= 0xFF
+        with self.assertRaises(ValueError):
+            stream = io.BytesIO(bytes(data))
+            _, checksum_type = bgcode.read_file_header(stream)
+            list(bgcode.iter_blocks(stream, checksum_type))
@@ -0,0 +1,91 @@
+import unittest
+
+import numpy as np
+
+from bedmesh.apply_to_gcode import apply_bed_mesh_to_gcode, interpolate_surface_z
+from bedmesh.interpolate import interpolate_surface
+from bedmesh.klipper_mesh import KlipperZMesh
+from bedmesh.parse import SurfaceMesh, _MeshMeta
+
+
+def _make_mesh(z, algo="bicubic", x_pps=2, y_pps=2, tension=0.2):
+    y_count, x_count = z.shape
+    meta = _MeshMeta(x_count, y_count, 0.0, 100.0, 0.0, 100.0, x_pps, y_pps, algo, tension)
+    x = np.linspace(0.0, 100.0, x_count)
+    y = np.linspace(0.0, 100.0, y_count)
+    return SurfaceMesh(x=x, y=y, z=z, z_top=float(np.max(z)), meta=meta)
+
+
+class TestKlipperZMesh(unittest.TestCase):
+    def test_table_keeps_probed_points(self):
+        z = np.random.default_rng(1).normal(size=(5, 6))
+        zmesh = KlipperZMesh(_make_mesh(z, x_pps=3, y_pps=2))
+        self.assertEqual(zmesh.table.shape, (13, 21))
+        np.testing.assert_allclose(zmesh.table[::3, ::4], z)
+
+    def test_bicubic_midpoint(self):
+        # Кардинальный сплайн при t = 0.5: (p1 + p2) / 2 + (m1 - m2) / 8
+        z = np.tile([0.0, 1.0, 4.0, 9.0], (4, 1))
+        zmesh = KlipperZMesh(_make_mesh(z, x_pps=1, y_pps=0, tension=0.2))
+        m1 = 0.2 * (4.0 - 0.0)
+        m2 = 0.2 * (9.0 - 1.0)
+        self.assertAlmostEqual(zmesh.table[0, 3], 2.5 + (m1 - m2) / 8)
+
+    def test_small_bicubic_falls_back_to_lagrange(self):
+        x = np.linspace(0.0, 100.0, 3)
+        z = np.tile(0.01 * x, (3, 1))
+        zmesh = KlipperZMesh(_make_mesh(z))
+        self.assertEqual(zmesh.algo, "lagrange")
+        self.assertAlmostEqual(zmesh.calc_z(37.0, 60.0), 0.37)
+
+    def test_zero_pps_is_direct(self):
+        z = np.arange(16, dtype=float).reshape(4, 4)
+        zmesh = KlipperZMesh(_make_mesh(z, x_pps=0, y_pps=0))
+        self.assertEqual(zmesh.algo, "direct")
+        np.testing.assert_array_equal(zmesh.table, z)
+
+    def test_lagrange_too_many_points(self):
+        with self.assertRaises(ValueError):
+            KlipperZMesh(_make_mesh(np.zeros((7, 7)), algo="lagrange"))
+
+    def test_outside_mesh_is_clamped(self):
+        z = np.random.default_rng(2).normal(size=(4, 4))
+        zmesh = KlipperZMesh(_make_mesh(z))
+        self.assertAlmostEqual(zmesh.calc_z(-20.0, -20.0), z[0, 0])
+        self.assertAlmostEqual(zmesh.calc_z(150.0, 150.0), z[-1, -1])
+
+    def test_grid_call_matches_points(self):
+        z = np.random.default_rng(3).normal(size=(5, 5))
+        zmesh = KlipperZMesh(_make_mesh(z))
+        xs = np.array([3.0, 41.5, 99.0])
+        ys = np.array([12.0, 77.7])
+        grid = zmesh(ys, xs)
+        self.assertEqual(grid.shape, (2, 3))
+        self.assertAlmostEqual(grid[1, 2], zmesh.calc_z(99.0, 77.7))
+
+    def test_calc_z_matches_vectorized(self):
+        z = np.random.default_rng(5).normal(size=(6, 6))
+        zmesh = KlipperZMesh(_make_mesh(z))
+        for x, y in [(0.0, 0.0), (12.3, 87.6), (-5.0, 50.0), (100.0, 120.0), (66.6, 33.3)]:
+            expected = float(zmesh(np.array([y]), np.array([x]))[0, 0])
+            self.assertEqual(zmesh.calc_z(x, y), expected)
+            self.assertEqual(interpolate_surface_z(zmesh, x, y), expected)
+
+    def test_interpolate_surface_klipper(self):
+        z = np.random.default_rng(4).normal(size=(5, 5))
+        mesh = _make_mesh(z)
+        result = interpolate_surface(mesh, resolution=13, method="klipper")
+        np.testing.assert_allclose(result.z, KlipperZMesh(mesh).table)
+        self.assertIsNone(result.meta)
+
+    def test_without_meta_is_direct(self):
+        z = np.random.default_rng(6).normal(size=(5, 5))
+        mesh = SurfaceMesh(x=np.linspace(0.0, 100.0, 5), y=np.linspace(0.0, 100.0, 5), z=z)
+        zmesh = KlipperZMesh(mesh)
+        self.assertEqual(zmesh.algo, "direct")
+        np.testing.assert_array_equal(zmesh.table, z)
+
+    def test_apply_with_klipper_method(self):
+        z = np.full((4, 4), 0.1)
+        output = apply_bed_mesh_to_gcode(["G1 X10 Y10 Z0.2 E1.0"], _make_mesh(z), method="klipper")
+        self.assertIn("Z0.30000", output[-1])
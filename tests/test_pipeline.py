@@ -0,0 +1,89 @@
+import unittest
+
+import numpy as np
+
+from bedmesh.dome_deformation import apply_dome_compensation
+from bedmesh.interpolate import interpolate_surface_with_extension
+from bedmesh.klipper_mesh import KlipperZMesh
+from bedmesh.parse import SurfaceMesh, parse_bed_mesh
+from bedmesh.pipeline import MeshPipeline
+from bedmesh.smooth import smooth_surface_laplacian_partial
+
+MESH_TEXT = """
+[bed_mesh default]
+version: 1
+points:
+  0.010000, 0.020000, 0.030000, 0.040000, 0.050000
+  0.015000, 0.060000, 0.080000, 0.070000, 0.020000
+  0.000000, 0.090000, 0.120000, 0.100000, 0.010000
+  -0.010000, 0.050000, 0.070000, 0.060000, 0.000000
+  -0.020000, -0.010000, 0.000000, 0.010000, 0.030000
+x_count: 5
+y_count: 5
+mesh_x_pps: 2
+mesh_y_pps: 2
+algo: bicubic
+tension: 0.2
+min_x: 5.0
+max_x: 345.0
+min_y: 5.0
+max_y: 345.0
+"""
+
+
+class TestMeshPipeline(unittest.TestCase):
+    def test_plan(self):
+        self.assertEqual(MeshPipeline().plan(), ["smooth", "interpolate"])
+        self.assertEqual(MeshPipeline(smooth_iterations=0, dome_delta=0.3, resolution=None).plan(), ["dome"])
+
+    def test_matches_separate_stages(self):
+        pipeline = MeshPipeline(smooth_iterations=2, smooth_lambda=0.5, dome_delta=0.3, dome_compensation=0.5,
+                                resolution=40, edge_offset=0.2)
+        result = pipeline.run(MESH_TEXT)
+
+        mesh = parse_bed_mesh(MESH_TEXT)
+        mesh = smooth_surface_laplacian_partial(mesh, iterations=2, lam=0.5)
+        mesh = apply_dome_compensation(mesh, delta=0.3, compensation=0.5)
+        expected = interpolate_surface_with_extension(mesh, 40, 0.2)
+
+        np.testing.assert_array_equal(result.z, expected.z)
+        self.assertEqual(result.z_top, expected.z_top)
+
+    def test_does_not_modify_input_mesh(self):
+        mesh = parse_bed_mesh(MESH_TEXT)
+        z_before = mesh.z.copy()
+        MeshPipeline(dome_delta=0.3, resolution=None).run(mesh)
+        np.testing.assert_array_equal(mesh.z, z_before)
+
+    def test_klipper_gcode_matches_firmware(self):
+        pipeline = MeshPipeline(method="klipper")
+        self.assertEqual(pipeline.smooth_iterations, 0)
+        output = pipeline.apply_to_gcode(MESH_TEXT, ["G1 X37.3 Y122.1 Z0.2 E1.0"])
+
+        expected = 0.2 + KlipperZMesh(parse_bed_mesh(MESH_TEXT)).calc_z(37.3, 122.1)
+        self.assertIn(f"Z{expected:.5f}", output[-1])
+
+    def test_float32(self):
+        result = MeshPipeline(resolution=30, dtype=np.float32).run(MESH_TEXT)
+        reference = MeshPipeline(resolution=30).run(MESH_TEXT)
+        self.assertEqual(result.z.dtype, np.float32)
+        np.testing.assert_allclose(result.z, reference.z, atol=1e-6)
+
+
+class TestInplaceStages(unittest.TestCase):
+    def test_inplace_smoothing_resets_z_top(self):
+        z = np.zeros((4, 4))
+        z[1, 1] = 1.0
+        mesh = SurfaceMesh(x=np.arange(4.0), y=np.arange(4.0), z=z, z_top=1.0)
+        result = smooth_surface_laplacian_partial(mesh, iterations=1, lam=1.0, inplace=True)
+        self.assertIs(result, mesh)
+        self.assertIs(result.z, z)
+        self.assertIsNone(result.z_top)
+
+    def test_copy_smoothing_keeps_z_top(self):
+        z = np.zeros((4, 4))
+        z[1, 1] = 1.0
+        mesh = SurfaceMesh(x=np.arange(4.0), y=np.arange(4.0), z=z, z_top=1.0)
+        result = smooth_surface_laplacian_partial(mesh, iterations=1, lam=1.0)
+        self.assertEqual(result.z_top, 0.25)
+        self.assertEqual(mesh.z[1, 1], 1.0)
@@ -0,0 +1,138 @@
+import os
+import tempfile
+import unittest
+from collections import Counter
+
+import numpy as np
+
+from bedmesh.klipper_mesh import KlipperZMesh
+from bedmesh.parse import SurfaceMesh, parse_bed_mesh
+from bedmesh.stl_export import generate_stl_from_surface, generate_tiled_stl_from_surface, shim_triangle_count, \
+    split_surface_into_tiles
+from cli.bed_mesh_to_stl_strict import generate_stl_from_bed_mesh_text
+from tests.test_pipeline import MESH_TEXT
+
+STL_RECORD = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attr", "<u2")])
+
+
+def _make_surface(res_x=21, res_y=17):
+    x = np.linspace(0.0, 200.0, res_x)
+    y = np.linspace(0.0, 160.0, res_y)
+    z = 0.001 * np.add.outer(y, x)
+    return SurfaceMesh(x=x, y=y, z=z)
+
+
+def _read_stl(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    count = int(np.frombuffer(data, dtype="<u4", count=1, offset=80)[0])
+    records = np.frombuffer(data, dtype=STL_RECORD, offset=84)
+    assert len(records) == count
+    return records
+
+
+class TestStlExport(unittest.TestCase):
+    def test_closed_shim(self):
+        mesh = _make_surface(res_x=4, res_y=3)
+        mesh.z[1, 2] = 0.5
+        with tempfile.TemporaryDirectory() as tmp:
+            records = _read_stl(generate_stl_from_surface(mesh, os.path.join(tmp, "shim.stl")))
+        self.assertEqual(len(records), shim_triangle_count(mesh))
+
+        v = records["vertices"]
+        # Первая ячейка низа: (x0, y0), (x0, y1), (x1, y0) по исходной поверхности
+        expected = np.array([[mesh.x[0], mesh.y[0], mesh.z[0, 0]],
+                             [mesh.x[0], mesh.y[1], mesh.z[1, 0]],
+                             [mesh.x[1], mesh.y[0], mesh.z[0, 1]]], dtype=np.float32)
+        np.testing.assert_array_equal(v[0], expected)
+        top = v[2 * 3 * 2:2 * 3 * 2 * 2]
+        self.assertTrue(np.all(top[..., 2] == np.float32(0.5)))
+
+        # Замкнутость: каждое ребро принадлежит ровно двум треугольникам
+        edges = Counter()
+        for tri in v.tolist():
+            tri = [tuple(p) for p in tri]
+            for a, b in zip(tri, tri[1:] + tri[:1]):
+                edges[frozenset((a, b))] += 1
+        self.assertEqual(set(edges.values()), {2})
+        np.testing.assert_allclose(np.linalg.norm(records["normal"], axis=1), 1.0, rtol=1e-6)
+
+
+class TestStlCli(unittest.TestCase):
+    def test_klipper_not_smoothed_by_default(self):
+        table = KlipperZMesh(parse_bed_mesh(MESH_TEXT)).table
+        with tempfile.TemporaryDirectory() as tmp:
+            records = _read_stl(generate_stl_from_bed_mesh_text(
+                MESH_TEXT, resolution=len(table), output_path=os.path.join(tmp, "shim.stl"), method="klipper"))
+        # Первый треугольник ячейки (1, 1) начинается в узле (1, 1) таблицы прошивки
+        cell = 1 * (len(table) - 1) + 1
+        self.assertEqual(records["vertices"][2 * cell, 0, 2], np.float32(table[1, 1]))
+
+
+class TestTiledStlExport(unittest.TestCase):
+    def test_tiles_share_edges(self):
+        mesh = _make_surface()
+        tiles = split_surface_into_tiles(mesh, tiles_x=3, tiles_y=2)
+        self.assertEqual((len(tiles), len(tiles[0])), (2, 3))
+        self.assertEqual(tiles[0][0].x[-1], tiles[0][1].x[0])
+        self.assertEqual(tiles[0][0].y[-1], tiles[1][0].y[0])
+        self.assertEqual(tiles[1][2].x[-1], mesh.x[-1])
+        self.assertTrue(all(tile.z_top == np.max(mesh.z) for row in tiles for tile in row))
+        self.assertTrue(np.shares_memory(tiles[1][1].z, mesh.z))
+
+    def test_overlap(self):
+        mesh = _make_surface()
+        tiles = split_surface_into_tiles(mesh, tiles_x=2, tiles_y=1, overlap=15.0)
+        # шаг сетки 10 мм -> перекрытие в 2 узла с каждой стороны
+        self.assertEqual(tiles[0][0].x[-1] - tiles[0][1].x[0], 40.0)
+
+    def test_too_many_tiles(self):
+        with self.assertRaises(ValueError):
+            split_surface_into_tiles(_make_surface(res_x=3), tiles_x=4, tiles_y=1)
+
+    def test_invalid_tile_count(self):
+        for tiles_x, tiles_y in ((0, 1), (1, 0), (-2, 2)):
+            with self.assertRaises(ValueError):
+                split_surface_into_tiles(_make_surface(), tiles_x=tiles_x, tiles_y=tiles_y)
+
+    def test_overlap_single_column(self):
+        # Шаг по x равен 0 — перекрытие по x не считается, а не делит на ноль
+        with self.assertRaises(ValueError):
+            split_surface_into_tiles(_make_surface(res_x=1), tiles_x=1, tiles_y=2, overlap=5.0)
+
+    def test_single_tile_matches_monolithic(self):
+        mesh = _make_surface()
+        with tempfile.TemporaryDirectory() as tmp:
+            whole = generate_stl_from_surface(mesh, os.path.join(tmp, "whole.stl"))
+            paths = generate_tiled_stl_from_surface(mesh, os.path.join(tmp, "shim.stl"), 1, 1)
+            self.assertEqual(paths, [os.path.join(tmp, "shim_0_0.stl")])
+            with open(whole, "rb") as a, open(paths[0], "rb") as b:
+                self.assertEqual(a.read(), b.read())
+
+    def test_separate_and_single_file(self):
+        mesh = _make_surface()
+        expected_faces = sum(shim_triangle_count(tile) for row in split_surface_into_tiles(mesh, 2, 2) for tile in row)
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = generate_tiled_stl_from_surface(mesh, os.path.join(tmp, "shim.stl"), 2, 2, max_workers=2)
+            self.assertEqual(len(paths), 4)
+            self.assertTrue(all(os.path.exists(path) for path in paths))
+
+            combined = generate_tiled_stl_from_surface(mesh, os.path.join(tmp, "all.stl"), 2, 2, single_file=True)
+            self.assertEqual(combined, [os.path.join(tmp, "all.stl")])
+            records = _read_stl(combined[0])
+            self.assertEqual(len(records), expected_faces)
+            separate = np.concatenate([_read_stl(path) for path in paths])
+            np.testing.assert_array_equal(records["vertices"], separate["vertices"])
+
+    def test_process_pool(self):
+        mesh = _make_surface()
+        with tempfile.TemporaryDirectory() as tmp:
+            threads = generate_tiled_stl_from_surface(mesh, os.path.join(tmp, "t.stl"), 2, 2, single_file=True)
+            processes = generate_tiled_stl_from_surface(mesh, os.path.join(tmp, "p.stl"), 2, 2, single_file=True,
+                                                        max_workers=2, use_processes=True)
+            separate = generate_tiled_stl_from_surface(mesh, os.path.join(tmp, "s.stl"), 2, 2,
+                                                       max_workers=2, use_processes=True)
+            with open(threads[0], "rb") as a, open(processes[0], "rb") as b:
+                self.assertEqual(a.read(), b.read())
+            self.assertEqual(len(separate), 4)
+            self.assertTrue(all(os.path.exists(path) for path in separate))